@@ -3,18 +3,37 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, stream_with_context, abort, before_render_template, template_rendered
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from flask.cli import AppGroup
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from filters import format_datetime, to_datetime
+import config
+import search
+import pagination
+import jsonstream
+import importer
+import exporter
+import autocomplete
+from cache import PageCache
+from conditional import conditional
+from assets import Assets
+from querystats import QueryStats
+from metrics import Metrics
 import sys
-from datetime import datetime
+import click
+import hmac
+import itertools
+from collections import Counter
+import dateutil.rrule
+from datetime import datetime, timedelta
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -22,27 +41,42 @@ from datetime import datetime
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
+app.config.from_object(config.get_config())
+if not app.config['SECRET_KEY']:
+  raise RuntimeError('Set FYYUR_SECRET_KEY to the same random value for every worker, e.g. the output of '
+                     'python -c "import secrets; print(secrets.token_hex(32))", or FYYUR_ENV=development '
+                     'to run locally with the development key')
+#overlapping() only looks MAX_SHOW_HOURS back for the shows a booking may overlap
+if not 0 < app.config['SHOW_DURATION_MINUTES'] <= MAX_SHOW_HOURS * 60:
+  raise RuntimeError(f'FYYUR_SHOW_DURATION_MINUTES must be between 1 and {MAX_SHOW_HOURS * 60}, the longest show')
 db = SQLAlchemy(app)
 migrate = Migrate(app,db)
+page_cache = PageCache(app)
+assets = Assets(app)
+query_stats = QueryStats(app)
+metrics = Metrics(app)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
-#Many to Many tables
-venues_show_items = db.Table('venue_show_items',
-    db.Column('show_id', db.Integer, db.ForeignKey('Show.id'), primary_key=True),
-    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
-)
+#Genres are a Postgres array, stored as JSON when the tests run on SQLite
+genres_type = db.ARRAY(db.String()).with_variant(db.JSON(), 'sqlite')
 
-artist_show_items = db.Table('artist_show_items',
-    db.Column('show_id', db.Integer, db.ForeignKey('Show.id'), primary_key=True),
-    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
-)
+def trigram_index(name, column):
+  return db.Index(name, column, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
 
+@search.register
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        trigram_index('ix_venue_name_trgm', 'name'),
+        trigram_index('ix_venue_city_trgm', 'city'),
+        db.Index('ix_venue_updated_at', 'updated_at'),
+        db.Index('ix_venue_next_show_at', 'next_show_at'),
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venue_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -55,18 +89,32 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120), nullable=False)
     seeking_talent = db.Column(db.Boolean, nullable=True,default=False)
     seeking_description = db.Column(db.String(), nullable=True,default="")
-    genres = db.Column(db.ARRAY(db.String()),nullable=False,server_default="{}")
-    shows = db.relationship('Shows', secondary=venues_show_items,lazy='subquery',backref=db.backref('venue', lazy=True))
+    genres = db.Column(genres_type,nullable=False,server_default="{}")
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    #show counters, kept up to date by count_new_shows, recount_shows and the roll-over command
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, nullable=True)
+    shows = db.relationship('Shows', backref='venue', lazy=True)
 
     def __repr__(self):
       return f'<Venue {self.id} {self.name}>'
 
+@search.register
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        trigram_index('ix_artist_name_trgm', 'name'),
+        trigram_index('ix_artist_city_trgm', 'city'),
+        db.Index('ix_artist_updated_at', 'updated_at'),
+        db.Index('ix_artist_next_show_at', 'next_show_at'),
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artist_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    genres = db.Column(db.ARRAY(db.String()),nullable=False,server_default="{}")
+    genres = db.Column(genres_type,nullable=False,server_default="{}")
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
@@ -75,41 +123,648 @@ class Artist(db.Model):
     website = db.Column(db.String(150), nullable=False)
     seeking_venue = db.Column(db.Boolean, nullable=True,default=False)
     seeking_description = db.Column(db.String(1000), nullable=True)
-    shows = db.relationship('Shows', secondary=artist_show_items,lazy='subquery',backref=db.backref('artist', lazy=True))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    #show counters, kept up to date by count_new_shows, recount_shows and the roll-over command
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, nullable=True)
+    shows = db.relationship('Shows', backref='artist', lazy=True)
 
     def __repr__(self):
       return f'<Artist {self.id} {self.name}>'
 
+def default_end_time(context):
+  """End of a show listed without one, SHOW_DURATION_MINUTES after its start
+  """
+  start_time = to_datetime(context.get_current_parameters()['start_time'])
+  return start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+
 class Shows(db.Model):
   __tablename__='Show'
+  __table_args__ = (
+    db.Index('ix_show_start_time', 'start_time'),
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_show_updated_at', 'updated_at'),
+    #shows collapsed by the end_time migration to an empty range may end as they start
+    db.CheckConstraint('end_time >= start_time', name='ck_show_end_time'),
+    #no two shows of a venue overlap, SQLite relies on venue_conflicts alone
+    ExcludeConstraint(
+      (db.column('venue_id'), '='),
+      (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+      name='ex_show_venue_time', using='gist',
+    ).ddl_if(dialect='postgresql'),
+  )
 
   id = db.Column(db.Integer,primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'),nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'),nullable=False)
   start_time = db.Column(db.DateTime,nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
   def __repr__(self):
     return f'<Show {self.id}>'
 
+class TableVersion(db.Model):
+  """Number of deletes from a table, which its max(updated_at) cannot tell"""
+  __tablename__='TableVersion'
+
+  name = db.Column(db.String(30), primary_key=True)
+  version = db.Column(db.Integer, nullable=False, default=0)
+
+  def __repr__(self):
+    return f'<TableVersion {self.name} {self.version}>'
+
+class GenreFacet(db.Model):
+  """Number of venues or artists of a genre in one city, for the browsing facets"""
+  __tablename__='GenreFacet'
+  __table_args__ = (
+    db.UniqueConstraint('kind', 'genre', 'state', 'city', name='uq_genre_facet'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  kind = db.Column(db.String(10), nullable=False)
+  genre = db.Column(db.String(), nullable=False)
+  state = db.Column(db.String(120), nullable=False)
+  city = db.Column(db.String(120), nullable=False)
+  count = db.Column(db.Integer, nullable=False, default=0)
+
+  def __repr__(self):
+    return f'<GenreFacet {self.kind} {self.genre} {self.city}, {self.state}: {self.count}>'
+
+#the catalog tables by the names the import and export commands use
+CATALOG = {
+  'venues': Venue,
+  'artists': Artist,
+  'shows': Shows,
+}
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+def page_args():
+  """Return the keyset cursors and the page size asked for by the request
+  """
+  size = request.values.get('per_page', app.config['PAGE_SIZE'], type=int)
+  return {
+    "after": request.values.get('after'),
+    "before": request.values.get('before'),
+    "size": min(max(size, 1), app.config['MAX_PAGE_SIZE']),
+  }
+
+@app.template_global()
+def page_url(**cursor):
+  """Url of the current page moved to the given after/before cursor
+    Keyword arguments:
+    cursor -- after= or before= with the cursor of the page to link to
+  """
+  args = request.values.to_dict(flat=False)
+  args.pop('after', None)
+  args.pop('before', None)
+  args.update(cursor)
+  return url_for(request.endpoint, **request.view_args, **args)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+  """Render a template piece by piece as the response is sent
+    Keyword arguments:
+    template_name -- the template to render
+    context -- the template variables, lazy iterables are read while rendering
+  """
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  #send a few kilobytes at a time rather than every small piece of markup
+  stream.enable_buffering(32)
+
+  def render():
+    #the render signals span the whole stream, as render_template's span the whole page
+    before_render_template.send(app, template=template, context=context)
+    for chunk in stream:
+      yield chunk
+    template_rendered.send(app, template=template, context=context)
+  return Response(stream_with_context(render()))
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# Shared by the pages and the JSON API, the *_ORDER lists are the keyset
+# orders the listings are paginated and streamed in.
+
+VENUES_ORDER = [(Venue.city, False), (Venue.state, False), (Venue.id, False)]
+ARTISTS_ORDER = [(Artist.id, False)]
+SHOWS_ORDER = [(Shows.start_time, False), (Shows.id, False)]
+
+def venues_query():
+  """Venues with their area and number of upcoming shows, read from the venue counter
+  """
+  return db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      Venue.upcoming_shows_count.label('num_upcoming_shows'),
+    )
+
+def artists_query():
+  """Artists with their area and number of upcoming shows, read from the artist counter
+  """
+  return db.session.query(
+      Artist.id,
+      Artist.name,
+      Artist.city,
+      Artist.state,
+      Artist.upcoming_shows_count.label('num_upcoming_shows'),
+    )
+
+def show_filters(args):
+  """Filters of the show feed read from a query string
+    Keyword arguments:
+    args -- the request arguments with start, end, city and genre
+  """
+  parseDate = lambda value: datetime.strptime(value, '%Y-%m-%d')
+  return {
+    "start": args.get('start', type=parseDate),
+    "end": args.get('end', type=parseDate),
+    "city": args.get('city', '').strip(),
+    "genre": args.get('genre', ''),
+  }
+
+def shows_query(filters):
+  """Shows with their venue and artist, upcoming shows only unless a date range is given
+    Keyword arguments:
+    filters -- the dict returned by show_filters
+  """
+  query = db.session.query(
+      Shows.id,
+      Shows.start_time,
+      Venue.id.label('venue_id'),
+      Venue.name.label('venue_name'),
+      Artist.id.label('artist_id'),
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+    ).join(Venue, Venue.id == Shows.venue_id
+    ).join(Artist, Artist.id == Shows.artist_id)
+  if filters['start'] is None and filters['end'] is None:
+    query = query.filter(Shows.start_time > datetime.now())
+  if filters['start'] is not None:
+    query = query.filter(Shows.start_time >= filters['start'])
+  if filters['end'] is not None:
+    query = query.filter(Shows.start_time < filters['end'] + timedelta(days=1))
+  if filters['city']:
+    query = query.filter(Venue.city.ilike(filters['city']))
+  if filters['genre'] in GENRES:
+    query = query.filter(search.has_genre(db.session, Artist.genres, filters['genre']))
+  return query
+
+def venue_details(venue):
+  """The venue page data with its past and upcoming shows
+    Keyword arguments:
+    venue -- the Venue
+  """
+  venue_id = venue.id
+  currentDatetime = datetime.now()
+  upcoming_shows = []
+  past_shows = []
+
+  #one query for the shows of the venue with their artist, the database tells which ones are past
+  shows = db.session.query(
+      Shows.artist_id,
+      Shows.start_time,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      (Shows.start_time < currentDatetime).label('past'),
+    ).join(Artist, Artist.id == Shows.artist_id
+    ).filter(Shows.venue_id == venue_id
+    ).order_by(Shows.start_time).all()
+
+  for show in shows:
+    showStruct = {
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": show.start_time,
+    }
+    if show.past:
+      past_shows.append(showStruct)
+    else:
+      upcoming_shows.append(showStruct)
+  #set the struct to return    
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres":venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description":venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+  return data
+
+def artist_details(artist):
+  """The artist page data with its past and upcoming shows
+    Keyword arguments:
+    artist -- the Artist
+  """
+  artist_id = artist.id
+  currentDatetime = datetime.now()
+  upcoming_shows = []
+  past_shows = []
+
+  #one query for the shows of the artist with their venue, the database tells which ones are past
+  shows = db.session.query(
+      Shows.venue_id,
+      Shows.start_time,
+      Venue.name.label('venue_name'),
+      Venue.image_link.label('venue_image_link'),
+      (Shows.start_time < currentDatetime).label('past'),
+    ).join(Venue, Venue.id == Shows.venue_id
+    ).filter(Shows.artist_id == artist_id
+    ).order_by(Shows.start_time).all()
+
+  for show in shows:
+    showStruct = {
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "venue_image_link": show.venue_image_link,
+      "start_time": show.start_time,
+    }
+    if show.past:
+      past_shows.append(showStruct)
+    else:
+      upcoming_shows.append(showStruct)
+  data={
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+  return data
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry their number of upcoming and past shows and the
+# start of their next show, so listings read them from the row. A new show
+# is counted in the transaction creating it, deletes and bulk loads recount
+# the rows they touch, and the roll-over command moves shows whose start has
+# passed from upcoming to past for the rows whose next_show_at is behind.
+
+SHOW_OWNERS = (
+  (Venue, Shows.venue_id),
+  (Artist, Shows.artist_id),
+)
+
+def count_new_show(venue_id, artist_id, start_time):
+  """Count a show being added in the counters of its venue and artist
+    Keyword arguments:
+    venue_id -- the integer id of the venue
+    artist_id -- the integer id of the artist
+    start_time -- the datetime the show starts
+  """
+  count_new_shows([{"venue_id": venue_id, "artist_id": artist_id, "start_time": start_time}])
+
+def count_new_shows(shows):
+  """Count shows being added in the counters of their venues and artists, without reading their other shows
+    Keyword arguments:
+    shows -- dicts of artist_id, venue_id and start_time
+  """
+  now = datetime.now()
+  for model, owner in SHOW_OWNERS:
+    counts = {}
+    for show in shows:
+      count = counts.setdefault(show[owner.key], {"b_id": show[owner.key], "b_upcoming": 0, "b_past": 0, "b_next": None})
+      if show["start_time"] > now:
+        count["b_upcoming"] += 1
+        if count["b_next"] is None or show["start_time"] < count["b_next"]:
+          count["b_next"] = show["start_time"]
+      else:
+        count["b_past"] += 1
+    #one statement executed once per venue or artist, updated_at moves through its onupdate
+    table = model.__table__
+    first = db.bindparam('b_next', type_=db.DateTime)
+    statement = table.update().where(table.c.id == db.bindparam('b_id')).values(
+      upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('b_upcoming'),
+      past_shows_count=table.c.past_shows_count + db.bindparam('b_past'),
+      next_show_at=db.case(
+        (db.or_(table.c.next_show_at == None, table.c.next_show_at > first), db.func.coalesce(first, table.c.next_show_at)),
+        else_=table.c.next_show_at),
+    )
+    db.session.execute(statement, list(counts.values()))
+
+def recount_shows(model, ids=None, now=None):
+  """Recompute the show counters of venues or artists from their shows
+    Keyword arguments:
+    model -- Venue or Artist
+    ids -- the ids of the rows to recount, every row when None
+    now -- the time separating past and upcoming shows
+  """
+  now = now or datetime.now()
+  owner = dict(SHOW_OWNERS)[model]
+  shows = lambda *columns: db.session.query(*columns).filter(owner == model.id)
+  values = {
+    model.upcoming_shows_count: shows(db.func.count(Shows.id)).filter(Shows.start_time > now).scalar_subquery(),
+    model.past_shows_count: shows(db.func.count(Shows.id)).filter(Shows.start_time <= now).scalar_subquery(),
+    model.next_show_at: shows(db.func.min(Shows.start_time)).filter(Shows.start_time > now).scalar_subquery(),
+  }
+  query = model.query
+  if ids is not None:
+    query = query.filter(model.id.in_(ids))
+  return query.update(values, synchronize_session=False)
+
+def roll_over_shows(now=None):
+  """Recount the venues and artists whose next show has started, return their ids
+    Keyword arguments:
+    now -- the time separating past and upcoming shows
+  """
+  now = now or datetime.now()
+  rolled = {}
+  for model, owner in SHOW_OWNERS:
+    ids = [id for id, in db.session.query(model.id).filter(model.next_show_at <= now)]
+    for start in range(0, len(ids), 1000):
+      recount_shows(model, ids[start:start + 1000], now)
+    rolled[model] = ids
+  db.session.commit()
+  return rolled
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# Shows of a venue must not overlap. No show lasts more than MAX_SHOW_HOURS,
+# so the shows overlapping a booking start less than that before it: the
+# check is a bounded range scan of ix_show_venue_id_start_time, whatever the
+# size of the venue's calendar. On Postgres the ex_show_venue_time exclusion
+# constraint also refuses the overlaps of concurrent bookings.
+
+def overlapping(venue_id, start_time, end_time):
+  """Criterion of the shows of the venue overlapping start_time to end_time
+  """
+  return db.and_(
+    Shows.venue_id == venue_id,
+    Shows.start_time > start_time - timedelta(hours=MAX_SHOW_HOURS),
+    Shows.start_time < end_time,
+    Shows.end_time > start_time,
+  )
+
+def venue_conflicts(venue_id, start_time, end_time):
+  """Shows already booked at the venue overlapping start_time to end_time
+    Keyword arguments:
+    venue_id -- the integer id of the venue
+    start_time -- the datetime the show starts
+    end_time -- the datetime the show ends
+  """
+  return Shows.query.filter(overlapping(venue_id, start_time, end_time)).order_by(Shows.start_time)
+
+def is_booking_conflict(failure):
+  """Whether an IntegrityError is the refusal of an overlapping booking by ex_show_venue_time
+    Keyword arguments:
+    failure -- the IntegrityError
+  """
+  #23P01 is exclusion_violation, other integrity errors (missing ids, ...) are not conflicts
+  return getattr(failure.orig, 'pgcode', None) == '23P01' or 'ex_show_venue_time' in str(failure.orig)
+
+def show_references_exist(form):
+  """Check the venue and artist of a show form exist, adding errors to its fields when not
+    Keyword arguments:
+    form -- the validated ShowForm
+  """
+  for field, model in ((form.venue_id, Venue), (form.artist_id, Artist)):
+    try:
+      exists = db.session.query(model.id).filter(model.id == int(field.data)).first() is not None
+    except ValueError:
+      exists = False
+    if not exists:
+      field.errors.append(f'No {model.__name__.lower()} has this ID')
+  return not form.venue_id.errors and not form.artist_id.errors
+
+def booking_conflicts(shows):
+  """Describe the overlaps of shows with each other and with the booked shows, in one query
+    Keyword arguments:
+    shows -- dicts of venue_id, start_time and end_time
+  """
+  conflicts = []
+  ordered = sorted(shows, key=lambda show: (show["venue_id"], show["start_time"]))
+  for before, after in zip(ordered, ordered[1:]):
+    if before["venue_id"] == after["venue_id"] and after["start_time"] < before["end_time"]:
+      conflicts.append(f'Venue {after["venue_id"]} is listed twice at {after["start_time"]:%Y-%m-%d %H:%M}.')
+  booked = db.session.query(Shows.venue_id, Shows.start_time, Shows.end_time).filter(
+    db.or_(*[overlapping(show["venue_id"], show["start_time"], show["end_time"]) for show in shows]))
+  for venue_id, start_time, end_time in booked:
+    conflicts.append(f'Venue {venue_id} is already booked from {start_time:%Y-%m-%d %H:%M} to {end_time:%H:%M}.')
+  return conflicts
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#----------------------------------------------------------------------------#
+
+# GenreFacet holds the number of venues and artists of each genre per city,
+# kept up to date by the views creating, editing and deleting them and
+# recomputed after imports and by `flask genres recount`. The facet sidebar
+# sums that small table instead of unnesting the genres of every row.
+
+def count_genres(model, row, delta):
+  """Add delta to the facet counts of the genres of a venue or artist
+    Keyword arguments:
+    model -- Venue or Artist
+    row -- the venue or artist, as stored
+    delta -- 1 when it is added, -1 when it is removed
+  """
+  for genre in set(row.genres or []):
+    key = {"kind": model.__tablename__, "genre": genre, "state": row.state or '', "city": row.city or ''}
+    updated = GenreFacet.query.filter_by(**key).update({GenreFacet.count: GenreFacet.count + delta}, synchronize_session=False)
+    if not updated and delta > 0:
+      db.session.add(GenreFacet(count=delta, **key))
+
+def recount_genres(model):
+  """Recompute the facet counts of venues or artists from their rows
+    Keyword arguments:
+    model -- Venue or Artist
+  """
+  kind = model.__tablename__
+  counts = Counter()
+  for genres, state, city in db.session.query(model.genres, model.state, model.city).yield_per(5000):
+    for genre in set(genres or []):
+      counts[(genre, state or '', city or '')] += 1
+  GenreFacet.query.filter_by(kind=kind).delete(synchronize_session=False)
+  if counts:
+    db.session.execute(GenreFacet.__table__.insert(), [
+      {"kind": kind, "genre": genre, "state": state, "city": city, "count": count}
+      for (genre, state, city), count in counts.items()])
+
+def browse_filters(args):
+  """Filters of the venue and artist listings read from a query string
+    Keyword arguments:
+    args -- the request arguments with genre (repeatable), city and state
+  """
+  return {
+    "genres": [genre for genre in args.getlist('genre') if genre in GENRES],
+    "city": args.get('city', '').strip(),
+    "state": args.get('state', '').strip().upper(),
+  }
+
+def filter_catalog(query, model, filters):
+  """Restrict a query of venues or artists to the rows matching filters
+    Keyword arguments:
+    query -- the query selecting from model
+    model -- Venue or Artist
+    filters -- the dict returned by browse_filters
+  """
+  #genre containment is answered by the GIN index on genres, the city by the trigram index
+  if filters['genres']:
+    query = query.filter(search.has_genres(db.session, model.genres, filters['genres']))
+  if filters['city']:
+    query = query.filter(model.city.ilike(filters['city']))
+  if filters['state']:
+    query = query.filter(model.state == filters['state'])
+  return query
+
+def genre_facets(model, filters):
+  """Genres of the venues or artists in the city and state of filters with their counts, largest first
+    Keyword arguments:
+    model -- Venue or Artist
+    filters -- the dict returned by browse_filters
+  """
+  count = db.func.sum(GenreFacet.count).label('count')
+  query = db.session.query(GenreFacet.genre, count).filter(GenreFacet.kind == model.__tablename__, GenreFacet.count > 0)
+  if filters['city']:
+    query = query.filter(GenreFacet.city.ilike(filters['city']))
+  if filters['state']:
+    query = query.filter(GenreFacet.state == filters['state'])
+  return query.group_by(GenreFacet.genre).order_by(count.desc(), GenreFacet.genre).all()
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+def venue_page_tags(venue_id):
+  """Cache tags of every page showing data of the venue
+    Keyword arguments:
+    venue_id -- the integer id of the venue
+  """
+  artists = db.session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()
+  return ['venues', 'shows', f'venue:{venue_id}'] + [f'artist:{artist.artist_id}' for artist in artists]
+
+def artist_page_tags(artist_id):
+  """Cache tags of every page showing data of the artist
+    Keyword arguments:
+    artist_id -- the integer id of the artist
+  """
+  venues = db.session.query(Shows.venue_id).filter(Shows.artist_id == artist_id).distinct()
+  return ['artists', 'shows', f'artist:{artist_id}'] + [f'venue:{venue.venue_id}' for venue in venues]
+
+#----------------------------------------------------------------------------#
+# HTTP validators.
+#----------------------------------------------------------------------------#
+
+# Each returns (last_modified, state) for conditional GET from a single
+# statement of index lookups, whatever the size of the tables: the newest
+# updated_at of a table (ix_*_updated_at), its TableVersion, bumped by
+# deletes, and the start of the next upcoming show (ix_show_start_time and
+# ix_show_venue_id_start_time / ix_show_artist_id_start_time), which moves
+# once that show has begun and left the upcoming lists.
+# Deletes and shows beginning leave every updated_at as it was, so no
+# Last-Modified is sent: only the ETag, which hashes the whole state, can
+# tell a page is still fresh.
+
+def bump_table_versions(*models):
+  """Count a delete from the tables of models, in the running transaction
+    Keyword arguments:
+    models -- the models rows were deleted from
+  """
+  for model in models:
+    name = model.__tablename__
+    updated = TableVersion.query.filter_by(name=name).update({TableVersion.version: TableVersion.version + 1}, synchronize_session=False)
+    if not updated:
+      db.session.add(TableVersion(name=name, version=1))
+
+def table_version(model):
+  """Subquery of the TableVersion of model, None until a first delete
+  """
+  return db.select(TableVersion.version).where(TableVersion.name == model.__tablename__).scalar_subquery()
+
+def table_state(*models):
+  """Subqueries of the newest updated_at and the TableVersion of each model
+  """
+  columns = []
+  for model in models:
+    columns.append(db.select(db.func.max(model.updated_at)).scalar_subquery())
+    columns.append(table_version(model))
+  return columns
+
+def next_show(*criterion):
+  """Subquery of the start of the next upcoming show among the shows matching criterion
+  """
+  return db.select(db.func.min(Shows.start_time)).where(Shows.start_time > datetime.now(), *criterion).scalar_subquery()
+
+def venues_validators():
+  #upcoming show counts and facets change with the venue rows
+  state = db.session.query(*table_state(Venue)).one()
+  return None, tuple(state)
+
+def artists_validators():
+  state = db.session.query(*table_state(Artist)).one()
+  return None, tuple(state)
+
+def shows_validators():
+  state = db.session.query(*table_state(Shows, Venue, Artist), next_show()).one()
+  return None, tuple(state)
+
+def venue_validators(venue_id):
+  #new shows of the venue move its updated_at through its counters, its artists are
+  #followed through the newest artist change
+  venue = db.select(Venue.updated_at).where(Venue.id == venue_id).scalar_subquery()
+  state = db.session.query(venue, next_show(Shows.venue_id == venue_id), *table_state(Artist)).one()
+  if state[0] is None:
+    return None
+  return None, tuple(state)
+
+def artist_validators(artist_id):
+  artist = db.select(Artist.updated_at).where(Artist.id == artist_id).scalar_subquery()
+  state = db.session.query(artist, next_show(Shows.artist_id == artist_id), *table_state(Venue)).one()
+  if state[0] is None:
+    return None
+  return None, tuple(state)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@page_cache.cached('home')
 def index():
   return render_template('pages/home.html')
 
@@ -118,73 +773,60 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(venues_validators)
+@page_cache.cached('venues')
 def venues():
-  """Get the entire venues list
-    Keyword arguments:
-  """
-  venues = Venue.query.order_by(Venue.city,Venue.state).all()
-  data = []
-  #sort in function of city and states
-  for venue in venues:
-    foundLocation = False
-    for location in data:
-      if location.city == venue.city and location.state == venue.state:
-        newVenue = {
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows":0,
-        }
-        location.venues.append(newVenue)
-        foundLocation = True
-    if foundLocation == False:
-      newVenue = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows":0,
-      }
-      newLocation = {
-        "city":venue.city,
-        "state": venue.state,
-        "venues":[newVenue],
-      }
-      data.append(newLocation)
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  """Get the entire venues list, or the venues matching the filters
+    Keyword arguments (query string):
+    genre -- genre the venues must have, repeatable
+    city -- city of the venues
+    state -- state of the venues
+  """
+  #one query: a page of venues ordered by area with their upcoming show counters,
+  #read while the page renders, and one for the genre counts of the sidebar
+  filters = browse_filters(request.args)
+  facets = genre_facets(Venue, filters)
+  page = pagination.paginate_stream(filter_catalog(venues_query(), Venue, filters), VENUES_ORDER, **page_args())
+
+  #rows come sorted by city and state, so a new area starts whenever the pair changes
+  areas = ({
+    "city": city,
+    "state": state,
+    "venues": [{
+      "id": venue.id,
+      "name": venue.name,
+      "num_upcoming_shows": venue.num_upcoming_shows,
+    } for venue in venues],
+  } for (city, state), venues in itertools.groupby(page, key=lambda venue: (venue.city, venue.state)))
+  return stream_template('pages/venues.html', areas=areas, page=page, filters=filters, facets=facets)
+
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
   """Get the entire venues list for a certain search word
     Keyword arguments:
   """
-  # seach for venues with column Name containing word in "sear_term" 
-  search_term = request.form['search_term']
-  search = f'%{search_term}%'
-  #query the venue with WHERE LIKE case insentive
-  venues = Venue.query.filter(Venue.name.ilike(search)).all()
-  
+  # seach for venues matching the word in "search_term", optionally in city, state or genres too
+  search_term = request.values.get('search_term', '')
+  fields = request.values.getlist('search_fields')
+  #ranked venue search, upcoming shows are read from the venue counters
+  query = venues_query()
+  page = search.search(query, Venue, search_term, fields, **page_args())
+
   #start the response structure
   response={
-    "count": len(venues),
-    "data": [],
-  }
-  
-  currentDatetime = datetime.now()
-
-  #set  upcoming shows for the list of venues
-  for venue in venues:
-    upcomingShows = 0
-    for show in venue.shows: 
-      if currentDatetime < show.start_time:
-        upcomingShows = upcomingShows + 1
-    newItem = {
+    "count": page.total,
+    "data": [{
       "id": venue.id,
       "name": venue.name,
-      "num_upcoming_shows": upcomingShows,
-    }
-    response['data'].append(newItem)
+      "num_upcoming_shows": venue.num_upcoming_shows,
+    } for venue in page],
+  }
 
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term, search_fields=search.clean_fields(fields), page=page)
 
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_validators)
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   """Get the entire venue for a venue id
     Keyword arguments:
@@ -197,53 +839,7 @@ def show_venue(venue_id):
     flash(f'An error occurred. Venue with ID= {venue_id} does not exist.')
     return render_template('pages/home.html')
   else:
-    currentDatetime = datetime.now()
-    upcoming_shows = []
-    past_shows = []
-    artists_ids = []
-   
-    #get all artist id for the shows of the venue
-    for show in venue.shows:
-      if show.artist_id not in artists_ids:
-        artists_ids.append(show.artist_id)
-    
-    #query all artist with id in the array of ids
-    artists = db.session.query(Artist.id,Artist.name,Artist.image_link).filter(Artist.id.in_(artists_ids)).order_by(Artist.id).all()
-
-    #set the upcoming shows and past shows for the venue
-    for show in venue.shows:
-      past = currentDatetime > show.start_time
-      showStruct = {
-        "artist_id": show.artist_id,
-        "start_time": show.start_time.isoformat("T"),
-      }
-      for artist in artists:
-        if artist.id == show.artist_id:
-          showStruct['artist_name'] = artist.name
-          showStruct['artist_image_link'] = artist.image_link
-      if past:
-        past_shows.append(showStruct)
-      else:
-        upcoming_shows.append(showStruct)
-    #set the struct to return    
-    data = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres":venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description":venue.seeking_description,
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
+    data = venue_details(venue)
     return render_template('pages/show_venue.html', venue=data)
 
 @app.route('/venues/create', methods=['GET'])
@@ -270,8 +866,10 @@ def create_venue_submission():
     imageLink = venueDict['image_link']
     venueToAdd = Venue(name=name,city=city,state=state,address=address,phone=phone,genres=genresList,facebook_link=facebookLink,image_link=imageLink)
     db.session.add(venueToAdd)
+    count_genres(Venue, venueToAdd, 1)
     db.session.commit()
     idToreturn = venueToAdd.id
+    page_cache.invalidate('venues')
   except:
     db.session.rollback()
     error=True
@@ -311,6 +909,7 @@ def edit_venue_submission(venue_id):
   try:
     venueDict = request.form
     venue = Venue.query.get(venue_id)
+    count_genres(Venue, venue, -1)
     venue.name = venueDict['name']
     venue.city = venueDict['city']
     venue.state = venueDict['state']
@@ -319,7 +918,10 @@ def edit_venue_submission(venue_id):
     venue.genres = venueDict.getlist('genres')
     venue.facebook_Link = venueDict['facebook_link']
     venue.image_link = venueDict['image_link']
+    count_genres(Venue, venue, 1)
+    tags = venue_page_tags(venue_id)
     db.session.commit()
+    page_cache.invalidate(*tags)
   except:
     db.session.rollback()
     error=True
@@ -341,8 +943,18 @@ def delete_venue(venue_id):
   """
   error = False
   try:
+    tags = venue_page_tags(venue_id)
+    #the shows of the venue go with it, their artists are recounted in the same transaction
+    artistIds = [id for id, in db.session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()]
+    Shows.query.filter_by(venue_id=venue_id).delete(synchronize_session=False)
+    venue = db.session.query(Venue.genres, Venue.state, Venue.city).filter_by(id=venue_id).first()
+    if venue is not None:
+      count_genres(Venue, venue, -1)
     Venue.query.filter_by(id=venue_id).delete()
+    recount_shows(Artist, artistIds)
+    bump_table_versions(Shows, Venue)
     db.session.commit()
+    page_cache.invalidate(*tags)
   except:
     db.session.rollback()
     error=True
@@ -358,54 +970,50 @@ def delete_venue(venue_id):
 #  Artists Endpoints for CRUD Methods
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(artists_validators)
+@page_cache.cached('artists')
 def artists():
-  """Get the entire artists list
-    Keyword arguments:
+  """Get the entire artists list, or the artists matching the filters
+    Keyword arguments (query string):
+    genre -- genre the artists must have, repeatable
+    city -- city of the artists
+    state -- state of the artists
   """
-  # Query all Artist in database
-  artists = Artist.query.all()
-  data = []
-  for artist in artists:
-    newArtist = {
-      "id": artist.id,
-      "name":artist.name,
-    }
-    data.append(newArtist)
-  return render_template('pages/artists.html', artists=data)
+  # Query a page of artists ordered by id, read while the page renders, and the genre counts of the sidebar
+  filters = browse_filters(request.args)
+  facets = genre_facets(Artist, filters)
+  page = pagination.paginate_stream(filter_catalog(artists_query(), Artist, filters), ARTISTS_ORDER, **page_args())
+  data = ({
+    "id": artist.id,
+    "name": artist.name,
+  } for artist in page)
+  return stream_template('pages/artists.html', artists=data, page=page, filters=filters, facets=facets)
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
   """Get the entire artist list for a certain search word
     Keyword arguments:
   """
-  # seach for artist with column Name containing word in "sear_term" 
-  search_term = request.form['search_term']
-  search = f'%{search_term}%'
-  #query the artist with WHERE LIKE case insentive 
-  search_term = request.form['search_term']
-  search = f'%{search_term}%'
-  artists = Artist.query.filter(Artist.name.ilike(search)).all()
-  
-  response={
-    "count": len(artists),
-    "data": [],
-  }
+  # seach for artists matching the word in "search_term", optionally in city, state or genres too
+  search_term = request.values.get('search_term', '')
+  fields = request.values.getlist('search_fields')
+  #ranked artist search, upcoming shows are counted by the database
+  query = artists_query()
+  page = search.search(query, Artist, search_term, fields, **page_args())
 
-  currentDatetime = datetime.now()
-  for artist in artists:
-    upcomingShows = 0
-    for show in artist.shows: 
-      if currentDatetime < show.start_time:
-        upcomingShows = upcomingShows + 1
-    newItem = {
+  response={
+    "count": page.total,
+    "data": [{
       "id": artist.id,
       "name": artist.name,
-      "num_upcoming_shows": upcomingShows,
-    }
-    response['data'].append(newItem)
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+      "num_upcoming_shows": artist.num_upcoming_shows,
+    } for artist in page],
+  }
+  return render_template('pages/search_artists.html', results=response, search_term=search_term, search_fields=search.clean_fields(fields), page=page)
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_validators)
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   """Get the artist for a artist id
     Keyword arguments:
@@ -419,50 +1027,7 @@ def show_artist(artist_id):
     flash(f'An error occurred. Artist with ID= {artist_id} does not exist.')
     return render_template('pages/home.html')
   else:
-    currentDatetime = datetime.now()
-    upcoming_shows = []
-    past_shows = []
-    venues_ids = []
-   
-    #get the list of venues ids
-    for show in artist.shows:
-      if show.venue_id not in venues_ids:
-        venues_ids.append(show.venue_id)
-    
-    #query the venues with id in the query list of ids
-    venues = db.session.query(Venue.id,Venue.name,Venue.image_link).filter(Venue.id.in_(venues_ids)).order_by(Venue.id).all()
-    
-    for show in artist.shows:
-      past = currentDatetime > show.start_time
-      showStruct = {
-        "venue_id": show.venue_id,
-        "start_time": show.start_time.isoformat("T"),
-      }
-      for venue in venues:
-        if venue.id == show.venue_id:
-          showStruct['venue_name'] = venue.name
-          showStruct['venue_image_link'] = venue.image_link
-      if past:
-        past_shows.append(showStruct)
-      else:
-        upcoming_shows.append(showStruct)
-    data={
-      "id": artist_id,
-      "name": artist.name,
-      "genres": artist.genres,
-      "city": artist.city,
-      "state": artist.state,
-      "phone": artist.phone,
-      "website": artist.website,
-      "facebook_link": artist.facebook_link,
-      "seeking_venue": artist.seeking_venue,
-      "seeking_description": artist.seeking_description,
-      "image_link": artist.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
+    data = artist_details(artist)
     return render_template('pages/show_artist.html', artist=data)
 
 @app.route('/artists/create', methods=['GET'])
@@ -489,8 +1054,10 @@ def create_artist_submission():
     website = request.form['website']
     artist = Artist(name=name,city=city,state=state,phone=phone,genres=genresList,facebook_link=facebookLink,image_link=imageLink,website=website)
     db.session.add(artist)
+    count_genres(Artist, artist, 1)
     db.session.commit()
     idToreturn = artist.id
+    page_cache.invalidate('artists')
   except:
     db.session.rollback()
     error=True
@@ -529,6 +1096,7 @@ def edit_artist_submission(artist_id):
   error = False
   try:
     artist = Artist.query.get(artist_id)
+    count_genres(Artist, artist, -1)
     artist.name = request.form['name']
     artist.city = request.form['city']
     artist.state = request.form['state']
@@ -537,7 +1105,10 @@ def edit_artist_submission(artist_id):
     artist.website = request.form['website']
     artist.facebook_Link = request.form['facebook_link']
     artist.image_link = request.form['image_link']
+    count_genres(Artist, artist, 1)
+    tags = artist_page_tags(artist_id)
     db.session.commit()
+    page_cache.invalidate(*tags)
   except:
     db.session.rollback()
     error=True
@@ -556,24 +1127,30 @@ def edit_artist_submission(artist_id):
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_validators)
+@page_cache.cached('shows')
 def shows():
-  """render the entire list of shows
+  """render the list of shows, upcoming shows only unless a date range is asked
+    Keyword arguments (query string):
+    start -- first day of the range as YYYY-MM-DD
+    end -- last day of the range as YYYY-MM-DD
+    city -- city of the venue
+    genre -- genre of the artist
   """
   # displays list of shows at /shows
-  #query of all showsand the data for the venue and artist for each show
-  elements = db.session.query(Shows.id,Venue.id,Artist.id,Venue.name,Artist.name,Artist.image_link,Shows.start_time).all()
-  data=[]
-  for element in elements:
-    newItem = {
-      "venue_id": element[1],
-      "venue_name": element[3],
-      "artist_id": element[2],
-      "artist_name": element[4],
-      "artist_image_link": element[5],
-      "start_time": element[6].isoformat("T"),
-    }
-    data.append(newItem)
-  return render_template('pages/shows.html', shows=data)
+  filters = show_filters(request.args)
+  #query a page of shows with the data for the venue and artist of each show, keyed on start time,
+  #read while the page renders
+  page = pagination.paginate_stream(shows_query(filters), SHOWS_ORDER, **page_args())
+  data = ({
+    "venue_id": element.venue_id,
+    "venue_name": element.venue_name,
+    "artist_id": element.artist_id,
+    "artist_name": element.artist_name,
+    "artist_image_link": element.artist_image_link,
+    "start_time": element.start_time,
+  } for element in page)
+  return stream_template('pages/shows.html', shows=data, page=page, filters=filters, genres=GENRES)
 
 @app.route('/shows/create')
 def create_shows():
@@ -587,24 +1164,46 @@ def create_show_submission():
   """
   # called to create new shows in the db, upon submitting new show listing form
   error = False
-  try:
-    artist_id = request.form['artist_id']
-    venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
-    show = Shows(venue_id=venue_id,artist_id=artist_id,start_time=start_time)
-    venue = Venue.query.get(venue_id)
-    artist = Artist.query.get(artist_id)
-    venue.shows.append(show)
-    artist.shows.append(show)
-    db.session.add(show)
-    db.session.commit()
-  except:
-    db.session.rollback()
-    error=True
-    print(sys.exc_info())
-  finally:
-    db.session.close()
-  
+  conflict = False
+  form = ShowForm(request.form)
+  if form.validate() and show_references_exist(form):
+    venue_id = int(form.venue_id.data)
+    artist_id = int(form.artist_id.data)
+    start_time = form.start_time.data
+    try:
+      end_time = form.end_time.data or start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+      booked = venue_conflicts(venue_id, start_time, end_time).first()
+      if booked is not None:
+        conflict = True
+        form.start_time.errors.append(f'The venue is already booked from {booked.start_time:%Y-%m-%d %H:%M} to {booked.end_time:%Y-%m-%d %H:%M}')
+      else:
+        show = Shows(venue_id=venue_id,artist_id=artist_id,start_time=start_time,end_time=end_time)
+        db.session.add(show)
+        count_new_show(venue_id, artist_id, start_time)
+        db.session.commit()
+        page_cache.invalidate('shows', 'venues', f'venue:{venue_id}', f'artist:{artist_id}')
+    except OverflowError:
+      form.start_time.errors.append('Out of the range of supported dates')
+    except IntegrityError as failure:
+      db.session.rollback()
+      if is_booking_conflict(failure):
+        #a concurrent booking won the exclusion constraint
+        conflict = True
+        form.start_time.errors.append('The venue was just booked at an overlapping time')
+      else:
+        error = True
+        print(sys.exc_info())
+    except:
+      db.session.rollback()
+      error=True
+      print(sys.exc_info())
+    finally:
+      db.session.close()
+
+  if conflict:
+    return render_template('forms/new_show.html', form=form), 409
+  if any(field.errors for field in form):
+    return render_template('forms/new_show.html', form=form), 400
   if error:
     flash('An error occurred. Show could not be listed.')
     return render_template('pages/home.html')
@@ -612,6 +1211,239 @@ def create_show_submission():
     flash('Show was successfully listed!')
     return redirect(url_for('shows'))
 
+REPEATS = {
+  'daily': dateutil.rrule.DAILY,
+  'weekly': dateutil.rrule.WEEKLY,
+  'monthly': dateutil.rrule.MONTHLY,
+}
+
+def tour_shows(text):
+  """Parse one show per line of text, return the shows and the errors by line
+    Keyword arguments:
+    text -- lines of "artist_id, venue_id, start_time", blank lines are skipped
+  """
+  shows, errors = [], []
+  for number, line in enumerate(text.splitlines(), 1):
+    if not line.strip():
+      continue
+    try:
+      artist_id, venue_id, start_time = [part.strip() for part in line.split(',', 2)]
+      start_time = to_datetime(start_time)
+      shows.append({"artist_id": int(artist_id), "venue_id": int(venue_id), "start_time": start_time,
+                    "end_time": start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])})
+    except (ValueError, OverflowError):
+      errors.append(f'Line {number}: expected "artist_id, venue_id, start_time", got "{line.strip()}"')
+  return shows, errors
+
+def residency_shows(artist_id, venue_id, first_start_time, repeat, occurrences):
+  """Shows of one artist at one venue, repeating from a first show
+    Keyword arguments:
+    artist_id -- the integer id of the artist
+    venue_id -- the integer id of the venue
+    first_start_time -- the datetime of the first show
+    repeat -- daily, weekly or monthly
+    occurrences -- the number of shows
+  """
+  rule = dateutil.rrule.rrule(REPEATS[repeat], dtstart=first_start_time, count=occurrences)
+  duration = timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+  return [{"artist_id": artist_id, "venue_id": venue_id, "start_time": start_time, "end_time": start_time + duration}
+          for start_time in rule]
+
+def schedule_shows(shows):
+  """Insert many shows in one transaction, return the errors preventing it
+    Keyword arguments:
+    shows -- dicts of artist_id, venue_id, start_time and end_time
+  """
+  venueIds = {show["venue_id"] for show in shows}
+  artistIds = {show["artist_id"] for show in shows}
+  errors = []
+  for model, ids in ((Venue, venueIds), (Artist, artistIds)):
+    found = {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+    errors += [f'{model.__name__} with ID = {id} does not exist.' for id in sorted(ids - found)]
+  if errors:
+    return errors
+  errors = booking_conflicts(shows)
+  if errors:
+    return errors
+  #one multi-row insert, then the new shows added to the counters of their venues and artists
+  db.session.execute(Shows.__table__.insert(), shows)
+  count_new_shows(shows)
+  db.session.commit()
+  page_cache.invalidate('shows', 'venues', *[f'venue:{id}' for id in venueIds], *[f'artist:{id}' for id in artistIds])
+  return []
+
+@app.route('/shows/batch', methods=['GET'])
+def create_show_batch_form():
+  form = ShowBatchForm()
+  return render_template('forms/new_show_batch.html', form=form, limit=app.config['SHOW_BATCH_LIMIT'])
+
+@app.route('/shows/batch', methods=['POST'])
+def create_show_batch_submission():
+  """Schedule a tour or a residency from a request form, all its shows or none
+  """
+  form = ShowBatchForm(request.form)
+  form.validate()
+  limit = app.config['SHOW_BATCH_LIMIT']
+  shows, errors = tour_shows(form.shows.data or '')
+  if 'csrf_token' in form.errors:
+    errors.append('The form expired, please submit it again.')
+  if form.occurrences.errors:
+    #checked before the rule is expanded
+    errors.append(f'A residency has between 1 and {limit} shows.')
+  elif form.first_start_time.data is not None:
+    try:
+      artist_id, venue_id = int(form.artist_id.data), int(form.venue_id.data)
+    except (TypeError, ValueError):
+      artist_id = venue_id = None
+    if artist_id is None or form.repeat.data not in REPEATS:
+      errors.append('A residency needs an artist ID, a venue ID and a repeat.')
+    else:
+      occurrences = form.occurrences.data or 1
+      try:
+        residency = residency_shows(artist_id, venue_id, form.first_start_time.data, form.repeat.data, occurrences)
+      except (ValueError, OverflowError):
+        residency = []
+      #the rule stops short at the end of year 9999
+      if len(residency) < occurrences:
+        errors.append('The residency runs out of the range of supported dates.')
+      shows += residency
+  elif form.first_start_time.errors:
+    errors.append('The first start time must look like YYYY-MM-DD HH:MM.')
+  if not shows and not errors:
+    errors.append('No show to schedule.')
+  if len(shows) > limit:
+    errors.append(f'At most {limit} shows can be scheduled at once.')
+  if not errors:
+    try:
+      errors = schedule_shows(shows)
+    except IntegrityError as failure:
+      db.session.rollback()
+      if is_booking_conflict(failure):
+        errors = ['A venue was just booked at an overlapping time.']
+      else:
+        errors = ['An error occurred. The shows could not be listed.']
+        print(sys.exc_info())
+    except:
+      db.session.rollback()
+      errors = ['An error occurred. The shows could not be listed.']
+      print(sys.exc_info())
+    finally:
+      db.session.close()
+
+  if errors:
+    for message in errors[:10]:
+      flash(message)
+    return render_template('forms/new_show_batch.html', form=form, limit=limit), 400
+  flash(f'{len(shows)} shows were successfully listed!')
+  return redirect(url_for('shows'))
+
+#  API Endpoints, read only JSON
+#  ----------------------------------------------------------------
+
+# Lists are streamed from a server-side cursor in their listing order, every
+# endpoint accepts ?fields=a,b to return only some fields of each record.
+
+def api_list(query, order):
+  """Stream the rows of query as a JSON array
+    Keyword arguments:
+    query -- the rows to send
+    order -- the keyset order of the listing
+  """
+  fields = jsonstream.parse_fields(request.args.get('fields'))
+  rows = query.order_by(*pagination.order_clauses(order))
+  return Response(stream_with_context(jsonstream.stream_rows(rows, fields)), mimetype='application/json')
+
+def api_record(record):
+  fields = jsonstream.parse_fields(request.args.get('fields'))
+  return Response(jsonstream.dumps(jsonstream.select(record, fields)), mimetype='application/json')
+
+def api_not_found(message):
+  return Response(jsonstream.dumps({"error": message}), status=404, mimetype='application/json')
+
+def api_autocomplete(model):
+  """Names of model with a word starting with the q argument, from the worker's prefix index
+    Keyword arguments:
+    model -- Venue or Artist
+  """
+  prefix = request.args.get('q', '')
+  limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+  matches = autocomplete.complete(db.session, model, prefix, limit, app.config['AUTOCOMPLETE_REFRESH_SECONDS'],
+                                  table_version(model))
+  return Response(jsonstream.dumps(matches), mimetype='application/json')
+
+@app.route('/api/v1/venues/autocomplete')
+def api_venues_autocomplete():
+  return api_autocomplete(Venue)
+
+@app.route('/api/v1/artists/autocomplete')
+def api_artists_autocomplete():
+  return api_autocomplete(Artist)
+
+@app.route('/api/v1/venues')
+@conditional(venues_validators)
+def api_venues():
+  return api_list(filter_catalog(venues_query(), Venue, browse_filters(request.args)), VENUES_ORDER)
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@conditional(venue_validators)
+def api_venue(venue_id):
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return api_not_found(f'Venue with ID= {venue_id} does not exist.')
+  return api_record(venue_details(venue))
+
+@app.route('/api/v1/artists')
+@conditional(artists_validators)
+def api_artists():
+  return api_list(filter_catalog(artists_query(), Artist, browse_filters(request.args)), ARTISTS_ORDER)
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@conditional(artist_validators)
+def api_artist(artist_id):
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return api_not_found(f'Artist with ID= {artist_id} does not exist.')
+  return api_record(artist_details(artist))
+
+@app.route('/api/v1/shows')
+@conditional(shows_validators)
+def api_shows():
+  """Stream the shows, filtered like the /shows page
+  """
+  return api_list(shows_query(show_filters(request.args)), SHOWS_ORDER)
+
+#  Export Endpoint
+#  ----------------------------------------------------------------
+
+def export_authorized():
+  """Whether the request carries the EXPORT_TOKEN as a bearer token
+  """
+  expected = 'Bearer ' + app.config['EXPORT_TOKEN']
+  return hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode())
+
+@app.route('/export/<kind>')
+def export_catalog(kind):
+  """Stream a whole table as CSV or NDJSON, gzipped when asked
+    Keyword arguments:
+    kind -- venues, artists or shows
+    format -- csv (default) or ndjson, from the query string
+    gzip -- 1 to gzip the file, from the query string
+  """
+  #the endpoint only exists once a token is configured
+  if not app.config.get('EXPORT_TOKEN') or kind not in CATALOG:
+    abort(404)
+  if not export_authorized():
+    return Response('Unauthorized', status=401, headers={'WWW-Authenticate': 'Bearer'})
+  format = request.args.get('format', 'csv')
+  if format not in exporter.FORMATS:
+    abort(400)
+  gzipped = request.args.get('gzip') == '1'
+  body = stream_with_context(exporter.export(db.session, CATALOG[kind], format, gzipped))
+  response = Response(body, mimetype='application/gzip' if gzipped else exporter.MIMETYPES[format])
+  response.headers['Content-Disposition'] = f'attachment; filename={exporter.filename(kind, format, gzipped)}'
+  response.cache_control.no_store = True
+  return response
+
 #  Error Handlers
 #  ----------------------------------------------------------------
 
@@ -623,10 +1455,106 @@ def not_found_error(error):
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+#  Commands
+#  ----------------------------------------------------------------
+
+IMPORT_FORMS = {
+  'venues': VenueForm,
+  'artists': ArtistForm,
+  'shows': ShowForm,
+}
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(CATALOG)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(importer.FORMATS), help='Defaults to csv for .csv files, ndjson otherwise.')
+@click.option('--batch-size', type=int, help='Rows per insert and commit, IMPORT_BATCH_SIZE by default.')
+@click.option('--start-line', type=int, default=1, help='Skip the records before this line to resume an import.')
+@click.option('--rejects', type=click.File('w', encoding='utf-8'), help='Write the invalid records to this NDJSON file.')
+def import_command(kind, file, format, batch_size, start_line, rejects):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file
+    Keyword arguments:
+    kind -- venues, artists or shows
+    file -- the file to read, - for stdin
+  """
+  loader = importer.Importer(db.session, CATALOG[kind], IMPORT_FORMS[kind], batch_size or app.config['IMPORT_BATCH_SIZE'])
+  records = importer.read_records(file, format or importer.guess_format(file.name))
+  stats = loader.run(records, start_line, rejects)
+  click.echo(f'{stats.inserted} {kind} imported, {stats.rejected} rejected, '
+             f'{stats.elapsed:.1f}s ({stats.rate:.0f} rows/s), last line {stats.last_line}')
+
+  #show counters of the venues and artists given shows, genre facets of the imported venues or artists
+  for model, column in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    ids = sorted(stats.references.get(column, ()))
+    for start in range(0, len(ids), 1000):
+      recount_shows(model, ids[start:start + 1000])
+  if kind in ('venues', 'artists'):
+    recount_genres(CATALOG[kind])
+  db.session.commit()
+
+  #pages of other processes sharing the cache backend
+  tags = [kind, 'venues'] if kind == 'shows' else [kind]
+  tags += [f'venue:{id}' for id in stats.references.get('venue_id', ())]
+  tags += [f'artist:{id}' for id in stats.references.get('artist_id', ())]
+  page_cache.invalidate(*tags)
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(CATALOG)))
+@click.option('--format', 'format', type=click.Choice(exporter.FORMATS), default='csv', show_default=True)
+@click.option('--gzip', 'gzipped', is_flag=True, help='Gzip the output.')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='File to write, stdout by default.')
+def export_command(kind, format, gzipped, output):
+  """Write every venue, artist or show as CSV or NDJSON
+    Keyword arguments:
+    kind -- venues, artists or shows
+  """
+  for chunk in exporter.export(db.session, CATALOG[kind], format, gzipped):
+    output.write(chunk)
+
+show_commands = AppGroup('shows', help='Maintain the show counters of venues and artists.')
+app.cli.add_command(show_commands)
+
+@show_commands.command('roll-over')
+def roll_over_command():
+  """Move the shows that have started from upcoming to past in the counters
+  """
+  rolled = roll_over_shows()
+  tags = []
+  if rolled[Venue]:
+    tags += ['venues', 'shows'] + [f'venue:{id}' for id in rolled[Venue]]
+  if rolled[Artist]:
+    tags += ['artists', 'shows'] + [f'artist:{id}' for id in rolled[Artist]]
+  page_cache.invalidate(*set(tags))
+  click.echo(f'{len(rolled[Venue])} venues and {len(rolled[Artist])} artists rolled over')
+
+@show_commands.command('recount')
+def recount_command():
+  """Recompute the show counters of every venue and artist from their shows
+  """
+  for model in (Venue, Artist):
+    recount_shows(model)
+  db.session.commit()
+  page_cache.invalidate('venues', 'artists', 'shows')
+  click.echo('Show counters recomputed')
+
+genre_commands = AppGroup('genres', help='Maintain the genre counts of the browsing facets.')
+app.cli.add_command(genre_commands)
+
+@genre_commands.command('recount')
+def recount_genres_command():
+  """Recompute the genre counts of every venue and artist
+  """
+  for model in (Venue, Artist):
+    recount_genres(model)
+  db.session.commit()
+  page_cache.invalidate('venues', 'artists')
+  click.echo('Genre counts recomputed')
+
 #  App launch
 #  ----------------------------------------------------------------
 
-if not app.debug:
+#test runs (fab test, the query budget) keep the tracked error.log untouched
+if not app.debug and not app.testing:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
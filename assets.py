@@ -0,0 +1,250 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask assets build` copies every file under static/ into static/dist/
+with a content hash in its name, concatenates the page stylesheets and
+scripts into bundles, minifies CSS, writes .gz (and .br when the brotli
+package is installed) siblings of text assets and, when Pillow is
+installed, resized JPEG/WebP variants of the images. The result is listed
+in static/dist/manifest.json.
+
+Templates link files with asset_url('img/front-splash.jpg') and bundles
+with asset_bundle('css/app.css'); once built the urls point at
+/assets/<hashed name>, served precompressed with far-future immutable
+cache headers. Without a manifest both fall back to the plain /static/
+files, so development works without a build.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import abort, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+# bundles in the order their sources are linked by layouts/main.html
+BUNDLES = {
+    'css/app.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'js/app.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.ttf', '.otf', '.eot')
+IMAGE_WIDTHS = (480, 960, 1600)
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def fingerprint(path, content):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:10]}{ext}'
+
+
+def minify_css(css):
+    """Drop comments and redundant whitespace, leaving quoted strings alone."""
+    parts = []
+    for i, token in enumerate(_CSS_TOKENS.split(css)):
+        if i % 2:
+            if not token.startswith('/*'):
+                parts.append(token)
+            continue
+        token = re.sub(r'\s+', ' ', token)
+        token = re.sub(r'\s*([{};,>])\s*', r'\1', token)
+        token = re.sub(r':\s+', ':', token)
+        parts.append(token.replace(';}', '}'))
+    return ''.join(parts).strip()
+
+
+def rewrite_css_urls(css, source, target, files):
+    """Point the relative url() of css, read from source, at the hashed files as seen from target."""
+    def replace(match):
+        url = match.group(2).strip()
+        if re.match(r'^(data:|[a-z]+:|//|/|#)', url):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        logical = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        if logical not in files:
+            return match.group(0)
+        return 'url("%s%s")' % (posixpath.relpath(files[logical], posixpath.dirname(target)), suffix)
+    return _CSS_URL.sub(replace, css)
+
+
+class Assets(object):
+    """Builds the asset manifest and serves the fingerprinted files."""
+
+    def __init__(self, app=None):
+        self.manifest = {'files': {}, 'variants': {}}
+        self.served = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static = app.static_folder
+        self.dist = os.path.join(self.static, 'dist')
+        self.load()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.add_template_global(self.asset_url)
+        app.add_template_global(self.asset_bundle)
+        app.add_template_global(self.asset_srcset)
+
+        @app.cli.group()
+        def assets():
+            """Static asset pipeline."""
+
+        @assets.command('build')
+        def build():
+            """Fingerprint, bundle and precompress static/ into static/dist/."""
+            manifest = self.build()
+            click.echo(f"{len(manifest['files'])} assets written to {self.dist}")
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dist, 'manifest.json')) as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.served = set(self.manifest.get('served', ()))
+
+    # Templates.
+
+    def asset_url(self, filename):
+        hashed = self.manifest['files'].get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def asset_bundle(self, name):
+        """Urls to link for the bundle name, its sources when it is not built."""
+        if name in self.manifest['files']:
+            return [self.asset_url(name)]
+        return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+    def asset_srcset(self, filename, format='jpeg'):
+        variants = self.manifest['variants'].get(filename, {}).get(format, [])
+        return ', '.join(f"{url_for('assets', filename=hashed)} {width}w" for width, hashed in variants)
+
+    # Serving.
+
+    def serve(self, filename):
+        path = safe_join(self.dist, filename)
+        if path is None or filename not in self.served:
+            abort(404)
+        encodings = request.accept_encodings
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encodings[encoding] and os.path.isfile(path + suffix):
+                response = send_from_directory(self.dist, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, filename, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    # Building.
+
+    def _write(self, path, content):
+        target = os.path.join(self.dist, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as file:
+            file.write(content)
+        if path.endswith(COMPRESSIBLE):
+            with open(target + '.gz', 'wb') as file:
+                file.write(gzip.compress(content, 9))
+            try:
+                import brotli
+            except ImportError:
+                pass
+            else:
+                with open(target + '.br', 'wb') as file:
+                    file.write(brotli.compress(content))
+
+    def _sources(self):
+        for root, dirs, names in os.walk(self.static):
+            dirs[:] = [name for name in dirs if os.path.join(root, name) != self.dist]
+            for name in names:
+                if not name.startswith('.'):
+                    yield os.path.relpath(os.path.join(root, name), self.static).replace(os.sep, '/')
+
+    def _read(self, path):
+        with open(os.path.join(self.static, path), 'rb') as file:
+            return file.read()
+
+    def _emit(self, logical, content, manifest):
+        hashed = fingerprint(logical, content)
+        self._write(hashed, content)
+        manifest['files'][logical] = hashed
+        manifest['served'].append(hashed)
+        return hashed
+
+    def _css(self, logical, sources, manifest):
+        css = '\n'.join(rewrite_css_urls(self._read(source).decode('utf-8'), source, logical, manifest['files'])
+                        for source in sources)
+        return self._emit(logical, minify_css(css).encode('utf-8'), manifest)
+
+    def _images(self, logical, manifest):
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        image = Image.open(os.path.join(self.static, logical))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        root = posixpath.splitext(logical)[0]
+        variants = manifest['variants'][logical] = {'jpeg': [], 'webp': []}
+        for width in IMAGE_WIDTHS:
+            if width > image.width:
+                break
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for format, ext, options in (('jpeg', '.jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+                                         ('webp', '.webp', {'quality': 80, 'method': 6})):
+                path = os.path.join(self.dist, 'tmp' + ext)
+                resized.save(path, format.upper(), **options)
+                with open(path, 'rb') as file:
+                    content = file.read()
+                os.remove(path)
+                variants[format].append([width, self._emit(f'{root}-{width}w{ext}', content, manifest)])
+
+    def build(self):
+        if os.path.isdir(self.dist):
+            shutil.rmtree(self.dist)
+        os.makedirs(self.dist)
+        manifest = {'files': {}, 'variants': {}, 'served': []}
+        sources = sorted(self._sources())
+
+        # everything a stylesheet may refer to first, so url() can be rewritten
+        for logical in sources:
+            if not logical.endswith('.css'):
+                self._emit(logical, self._read(logical), manifest)
+                if logical.endswith(('.jpg', '.jpeg', '.png')):
+                    self._images(logical, manifest)
+        for logical in sources:
+            if logical.endswith('.css'):
+                self._css(logical, [logical], manifest)
+        for logical, parts in BUNDLES.items():
+            if logical.endswith('.css'):
+                self._css(logical, parts, manifest)
+            else:
+                self._emit(logical, b';\n'.join(self._read(part).rstrip() for part in parts), manifest)
+
+        with open(os.path.join(self.dist, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        self.manifest = manifest
+        self.served = set(manifest['served'])
+        return manifest
@@ -0,0 +1,167 @@
+"""Prefix autocomplete for venue and artist names.
+
+Each worker keeps, per model, a sorted list of (key, id) pairs where the
+keys are the casefolded name starting at each of its words, so "blue"
+finds "The Blue Hall" as well as "Blue Moon Club". A lookup bisects to
+the first key starting with the prefix and reads forward until it has
+enough distinct names: O(log n) whatever the size of the catalog.
+
+The lists are refreshed incrementally. At most every
+AUTOCOMPLETE_REFRESH_SECONDS a lookup asks for the rows whose updated_at
+moved past the index's stamp (served by the updated_at indexes) and
+re-indexes those that changed; a new version of the table, bumped by
+deletes, or more than REBUILD_AFTER changed rows rebuild it.
+Either way the new lists are built aside and swapped in, lookups never see
+a list being changed and take no lock.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+# changed rows past which rebuilding beats inserting one by one into the sorted list
+REBUILD_AFTER = 2000
+
+# updated_at comes from the clock of the worker writing the row, so rows are
+# read again until they are this old: a late commit, or a row stamped by a
+# host whose clock lags by less than that, is not skipped
+SETTLE_SECONDS = 5
+
+
+def keys(name):
+    """Return the casefolded name starting at each of its words."""
+    words = (name or '').casefold().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def _settled(stamp, newest):
+    """Return the stamp past which rows are read again, after reading rows up to newest."""
+    if newest is None:
+        return stamp
+    settled = min(newest, datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS))
+    return settled if stamp is None else max(stamp, settled)
+
+
+class PrefixIndex(object):
+    """Sorted (key, id) pairs of the names of one model, with the label of each id."""
+
+    def __init__(self, model, columns=('city', 'state')):
+        self.model = model
+        self.columns = columns
+        self.entries = []
+        self.labels = {}
+        self.stamp = None
+        self.version = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def _query(self, session):
+        model = self.model
+        return session.query(model.id, model.name, model.updated_at,
+                             *[getattr(model, column) for column in self.columns])
+
+    def _label(self, row):
+        label = {'id': row.id, 'name': row.name}
+        for column in self.columns:
+            label[column] = getattr(row, column)
+        return label
+
+    def rebuild(self, session):
+        entries = []
+        labels = {}
+        newest = None
+        for row in self._query(session):
+            labels[row.id] = self._label(row)
+            entries.extend((key, row.id) for key in keys(row.name))
+            newest = row.updated_at if newest is None or row.updated_at > newest else newest
+        entries.sort()
+        # swapped in whole, lookups running meanwhile keep reading the previous lists
+        self.entries, self.labels, self.stamp = entries, labels, _settled(None, newest)
+
+    @staticmethod
+    def _remove(entries, labels, id):
+        label = labels.pop(id, None)
+        if label is None:
+            return
+        for key in keys(label['name']):
+            position = bisect.bisect_left(entries, (key, id))
+            if position < len(entries) and entries[position] == (key, id):
+                del entries[position]
+
+    def refresh(self, session, interval=0.0, version=None):
+        """Bring the index up to date with the table, at most once per interval seconds.
+
+        version is a scalar subquery of the counter bumped by deletes from
+        the table, the index is rebuilt when it changes.
+        """
+        if time.monotonic() - self.checked < interval:
+            return
+        with self.lock:
+            if time.monotonic() - self.checked < interval:
+                return
+            self.checked = time.monotonic()
+            current = session.query(version).scalar() if version is not None else None
+            if self.stamp is None or current != self.version:
+                self.rebuild(session)
+                self.version = current
+                return
+            model = self.model
+            rows = self._query(session).filter(model.updated_at > self.stamp).limit(REBUILD_AFTER + 1).all()
+            if len(rows) > REBUILD_AFTER:
+                self.rebuild(session)
+                return
+            # rows not settled yet are read again, most of them indexed already
+            changed = [row for row in rows if self.labels.get(row.id) != self._label(row)]
+            if changed:
+                # changed on copies, lookups running meanwhile keep reading the previous lists
+                entries, labels = list(self.entries), dict(self.labels)
+                for row in changed:
+                    self._remove(entries, labels, row.id)
+                    labels[row.id] = self._label(row)
+                    for key in keys(row.name):
+                        bisect.insort(entries, (key, row.id))
+                self.entries, self.labels = entries, labels
+            self.stamp = _settled(self.stamp, max((row.updated_at for row in rows), default=None))
+
+    def lookup(self, prefix, limit=10):
+        """Return the labels of up to limit names with a word starting with prefix."""
+        prefix = ' '.join(prefix.casefold().split())
+        if not prefix:
+            return []
+        entries, labels = self.entries, self.labels
+        found = []
+        seen = set()
+        position = bisect.bisect_left(entries, (prefix,))
+        while position < len(entries) and len(found) < limit:
+            key, id = entries[position]
+            if not key.startswith(prefix):
+                break
+            label = labels.get(id)
+            if id not in seen and label is not None:
+                seen.add(id)
+                found.append(label)
+            position += 1
+        return found
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index_for(model):
+    """Return the worker's PrefixIndex of model."""
+    index = _indexes.get(model)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(model, PrefixIndex(model))
+    return index
+
+
+def complete(session, model, prefix, limit=10, interval=2.0, version=None):
+    """Return up to limit labels of model whose name has a word starting with prefix.
+
+    version is the subquery of the table's delete counter, see PrefixIndex.refresh.
+    """
+    index = index_for(model)
+    index.refresh(session, interval, version)
+    return index.lookup(prefix, limit)
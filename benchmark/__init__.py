@@ -0,0 +1 @@
+"""Benchmarks for Fyyur, run each module with python -m benchmark.<name>."""
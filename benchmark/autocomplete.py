@@ -0,0 +1,51 @@
+"""Autocomplete latency at scale.
+
+Fills an in-memory SQLite database with synthetic artists, then times
+/api/v1/artists/autocomplete through the Flask test client for prefixes
+of one to six letters taken from the generated names, after the first
+request has built the worker's index:
+
+    python -m benchmark.autocomplete --artists 100000
+"""
+import argparse
+import random
+import time
+
+from benchmark.dataset import NAME_WORDS, artists, import_app
+from benchmark.load import percentile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--artists', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    app = import_app('sqlite://')
+    with app.app.app_context():
+        app.db.create_all()
+        app.db.session.execute(app.Artist.__table__.insert(), list(artists(args.artists)))
+        app.db.session.commit()
+    client = app.app.test_client()
+
+    started = time.perf_counter()
+    client.get('/api/v1/artists/autocomplete?q=a').close()
+    print(f'index of {args.artists} artists built in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+    rnd = random.Random(args.seed)
+    prefixes = [rnd.choice(NAME_WORDS)[:rnd.randint(1, 6)] for _ in range(args.requests)]
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        response = client.get(f'/api/v1/artists/autocomplete?q={prefix}')
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+        response.close()
+    latencies.sort()
+    print(f"{args.requests} requests: p50 {percentile(latencies, 0.50) * 1000:.2f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
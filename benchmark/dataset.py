@@ -0,0 +1,228 @@
+"""Synthetic Fyyur catalog at a chosen scale.
+
+Venues and artists are spread over cities and genres with a Zipf skew, a
+few big cities and popular genres holding most rows, and shows go mostly
+to the popular venues and artists, on evenings from two years back to a
+year ahead:
+
+    python -m benchmark.dataset --database-url sqlite:///bench.db \\
+        --venues 10000 --artists 100000 --shows 1000000
+
+Rows are inserted in batches with explicit ids into the tables of app.py,
+created when missing (on Postgres prefer `flask db upgrade` first, which
+also builds the indexes of the migrations). --reset empties them first.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'), ('Phoenix', 'AZ'),
+    ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'), ('Dallas', 'TX'), ('San Jose', 'CA'),
+    ('Austin', 'TX'), ('Jacksonville', 'FL'), ('San Francisco', 'CA'), ('Columbus', 'OH'), ('Charlotte', 'NC'),
+    ('Indianapolis', 'IN'), ('Seattle', 'WA'), ('Denver', 'CO'), ('Washington', 'DC'), ('Boston', 'MA'),
+    ('Nashville', 'TN'), ('Detroit', 'MI'), ('Portland', 'OR'), ('Las Vegas', 'NV'), ('Memphis', 'TN'),
+    ('Louisville', 'KY'), ('Baltimore', 'MD'), ('Milwaukee', 'WI'), ('Albuquerque', 'NM'), ('Tucson', 'AZ'),
+    ('Sacramento', 'CA'), ('Kansas City', 'MO'), ('Atlanta', 'GA'), ('Miami', 'FL'), ('Raleigh', 'NC'),
+    ('Omaha', 'NE'), ('Minneapolis', 'MN'), ('Tulsa', 'OK'), ('New Orleans', 'LA'), ('Cleveland', 'OH'),
+]
+
+GENRES = [
+    'Rock n Roll', 'Pop', 'Hip-Hop', 'Jazz', 'Alternative', 'Country', 'Electronic', 'R&B', 'Blues', 'Folk',
+    'Soul', 'Punk', 'Heavy Metal', 'Classical', 'Reggae', 'Funk', 'Instrumental', 'Musical Theatre', 'Other',
+]
+
+NAME_WORDS = [
+    'Blue', 'Red', 'Golden', 'Velvet', 'Electric', 'Silver', 'Midnight', 'Wild', 'Lucky', 'Royal', 'Crystal',
+    'Black', 'Neon', 'Rusty', 'Lonely', 'Happy', 'Dueling', 'Musical', 'Park', 'Square', 'Garden', 'River',
+    'Moon', 'Sun', 'Owl', 'Fox', 'Tiger', 'Crow', 'Rose', 'Stone', 'Harbor', 'Hollow', 'Canyon', 'Echo',
+]
+VENUE_KINDS = ['Hall', 'Club', 'Lounge', 'Theatre', 'Tavern', 'Room', 'Bar', 'Arena', 'Garden', 'Stage']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Brothers', 'Sisters', 'Ensemble']
+
+
+class Zipf(object):
+    """Draws indexes 0..size-1 with probability proportional to 1 / (rank + 1) ** exponent."""
+
+    def __init__(self, size, exponent=1.1):
+        self.cumulative = list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(size)))
+
+    def draw(self, rnd):
+        return bisect.bisect_left(self.cumulative, rnd.random() * self.cumulative[-1])
+
+
+def _name(rnd, kinds):
+    words = rnd.sample(NAME_WORDS, rnd.choice((1, 2, 2, 3)))
+    return ' '.join(['The'] * (rnd.random() < 0.3) + words + [rnd.choice(kinds)])
+
+
+def _genres(rnd, zipf):
+    return sorted(set(GENRES[zipf.draw(rnd)] for _ in range(rnd.randint(1, 3))))
+
+
+def venues(count, seed=0):
+    rnd = random.Random(seed)
+    cities, genres = Zipf(len(CITIES)), Zipf(len(GENRES))
+    for id in range(1, count + 1):
+        city, state = CITIES[cities.draw(rnd)]
+        yield {
+            'id': id,
+            'name': f'{_name(rnd, VENUE_KINDS)} {id}',
+            'city': city,
+            'state': state,
+            'address': f'{rnd.randint(1, 9999)} {rnd.choice(NAME_WORDS)} Street',
+            'phone': f'{rnd.randint(200, 999)}-{rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/venues/{id}.jpg',
+            'website': f'https://venue{id}.example.com',
+            'facebook_link': f'https://www.facebook.com/venue{id}',
+            'seeking_talent': rnd.random() < 0.4,
+            'seeking_description': '',
+            'genres': _genres(rnd, genres),
+            'updated_at': datetime.utcnow(),
+        }
+
+
+def artists(count, seed=1):
+    rnd = random.Random(seed)
+    cities, genres = Zipf(len(CITIES)), Zipf(len(GENRES))
+    for id in range(1, count + 1):
+        city, state = CITIES[cities.draw(rnd)]
+        yield {
+            'id': id,
+            'name': f'{_name(rnd, ARTIST_KINDS)} {id}',
+            'genres': _genres(rnd, genres),
+            'city': city,
+            'state': state,
+            'phone': f'{rnd.randint(200, 999)}-{rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/artists/{id}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{id}',
+            'website': f'https://artist{id}.example.com',
+            'seeking_venue': rnd.random() < 0.3,
+            'seeking_description': None,
+            'updated_at': datetime.utcnow(),
+        }
+
+
+# two hour slots a show can start at, evenings twice as likely
+SLOT_HOURS = (12, 14, 16, 18, 18, 20, 20, 22, 22)
+SHOW_LENGTH = timedelta(hours=2)
+
+
+def shows(count, venue_count, artist_count, seed=2, now=None):
+    """Shows of mostly popular venues and artists, two thirds of them past.
+
+    A venue holds one show at a time: when the drawn venue is booked for the
+    drawn slot, another is drawn, uniformly once the popular ones are full.
+    """
+    rnd = random.Random(seed)
+    now = (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    # popularity ranks are shuffled so the busy venues are not simply the first ids
+    venue_order = list(range(1, venue_count + 1))
+    artist_order = list(range(1, artist_count + 1))
+    rnd.shuffle(venue_order)
+    rnd.shuffle(artist_order)
+    venue_zipf, artist_zipf = Zipf(venue_count, 0.8), Zipf(artist_count, 0.8)
+    booked = set()
+    for id in range(1, count + 1):
+        day, hour = rnd.randint(-730, 365), rnd.choice(SLOT_HOURS)
+        for attempt in itertools.count():
+            venue = venue_order[venue_zipf.draw(rnd)] if attempt < 20 else rnd.randint(1, venue_count)
+            if (venue, day, hour) not in booked:
+                break
+        booked.add((venue, day, hour))
+        start_time = now + timedelta(days=day, hours=hour - now.hour)
+        yield {
+            'id': id,
+            'venue_id': venue,
+            'artist_id': artist_order[artist_zipf.draw(rnd)],
+            'start_time': start_time,
+            'end_time': start_time + SHOW_LENGTH,
+            'updated_at': datetime.utcnow(),
+        }
+
+
+def import_app(database_url, env='testing'):
+    """Import app.py configured for database_url."""
+    os.environ.setdefault('FYYUR_ENV', env)
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['FYYUR_TEST_DATABASE_URL'] = database_url
+    import app
+    return app
+
+
+def _batches(rows, size):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def load(app, venue_count, artist_count, show_count, batch_size=10000, reset=False, report=print):
+    """Fill the database of app with a generated catalog, return the seconds taken per table."""
+    db = app.db
+    timings = {}
+    with app.app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+            db.session.commit()
+        db.create_all()
+        if reset:
+            for model in (app.Shows, app.Artist, app.Venue, app.GenreFacet):
+                db.session.query(model).delete()
+            app.bump_table_versions(app.Shows, app.Artist, app.Venue)
+            db.session.commit()
+        tables = [
+            (app.Venue, venues(venue_count)),
+            (app.Artist, artists(artist_count)),
+            (app.Shows, shows(show_count, venue_count, artist_count)),
+        ]
+        for model, rows in tables:
+            table = model.__table__
+            started = time.perf_counter()
+            inserted = 0
+            for batch in _batches(rows, batch_size):
+                db.session.execute(table.insert(), batch)
+                db.session.commit()
+                inserted += len(batch)
+            timings[table.name] = time.perf_counter() - started
+            report(f'{inserted} rows into {table.name} in {timings[table.name]:.1f}s')
+            if db.engine.dialect.name == 'postgresql':
+                sequence = db.func.pg_get_serial_sequence(f'"{table.name}"', 'id')
+                db.session.query(db.func.setval(sequence, db.func.coalesce(db.func.max(table.c.id), 1))).scalar()
+                db.session.commit()
+        # bulk inserts bypass the show counters and genre facets, compute them once at the end
+        started = time.perf_counter()
+        for model in (app.Venue, app.Artist):
+            app.recount_shows(model)
+            app.recount_genres(model)
+        db.session.commit()
+        timings['counters'] = time.perf_counter() - started
+        report(f"show counters and genre facets recomputed in {timings['counters']:.1f}s")
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:///bench.db')
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=100000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--reset', action='store_true', help='Empty the tables first.')
+    args = parser.parse_args(argv)
+    app = import_app(args.database_url)
+    load(app, args.venues, args.artists, args.shows, args.batch_size, args.reset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Cost of the datetime filter per show tile.
+
+Formats the start times of a page of synthetic shows the way the shows
+page did before (isoformat in the view, dateutil and Babel in the filter)
+and with filters.format_datetime, with and without memoization:
+
+    python -m benchmark.datetime_filter --shows 10000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from filters import format_datetime
+
+
+def legacy(value, format='medium'):
+    """The filter as it was: parse the ISO string back, then a full Babel call."""
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def make_start_times(size, seed=0):
+    """Shows on the evenings of the coming year, on the hour or half past."""
+    rnd = random.Random(seed)
+    today = datetime(2030, 1, 1)
+    return [today + timedelta(days=rnd.randrange(365), hours=rnd.randint(18, 23), minutes=rnd.choice((0, 30)))
+            for _ in range(size)]
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    times = make_start_times(args.shows)
+    expected = [legacy(value.isoformat('T'), 'full') for value in times]
+    assert expected == [format_datetime(value, 'full', memoize=False) for value in times]
+    assert expected == [format_datetime(value, 'full') for value in times]
+
+    runs = [
+        ('isoformat + dateutil + babel', lambda: [legacy(value.isoformat('T'), 'full') for value in times]),
+        ('datetime, cached pattern', lambda: [format_datetime(value, 'full', memoize=False) for value in times]),
+        ('datetime, memoized', lambda: [format_datetime(value, 'full') for value in times]),
+    ]
+    print(f'{args.shows} shows, {len(set(times))} distinct start times')
+    print(f"{'filter':>30} {'page ms':>9} {'us/tile':>8}")
+    for name, run in runs:
+        elapsed = timed(run, args.repeat)
+        print(f'{name:>30} {elapsed * 1000:>9.1f} {elapsed / args.shows * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
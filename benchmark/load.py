@@ -0,0 +1,267 @@
+"""Latency, throughput and memory of every route.
+
+Drives the routes of app.py against a database filled by
+benchmark.dataset, in process through the Flask test client or over HTTP
+against a running server, and reports p50/p95/p99 latency, requests per
+second and peak RSS for each route:
+
+    python -m benchmark.load --database-url sqlite:///bench.db --requests 200 --output run.json
+    python -m benchmark.load --url http://localhost:8000 --server-pid 1234 --concurrency 8
+    python -m benchmark.load --compare before.json after.json
+
+In process, the peak RSS is the benchmark's own, reset before each route
+where Linux allows it. Over HTTP it is read from --server-pid, when given,
+and only grows. Streaming routes are sent a twentieth of the requests.
+Writes are left out unless --writes is given, since they change the data
+later routes read.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from benchmark.dataset import CITIES, GENRES, import_app
+
+EXPORT_TOKEN = 'benchmark'
+
+# name, method, path (a function of the random generator and the catalog size), form data, share of requests
+ROUTES = [
+    ('index', 'GET', lambda r, c: '/', None, 1),
+    ('venues', 'GET', lambda r, c: '/venues', None, 1),
+    ('venues_large_page', 'GET', lambda r, c: '/venues?per_page=200', None, 1),
+    ('show_venue', 'GET', lambda r, c: f"/venues/{r.randint(1, c['venues'])}", None, 1),
+    ('search_venues', 'POST', lambda r, c: '/venues/search', lambda r, c: {'search_term': r.choice(['hall', 'blue', 'the', 'lounge'])}, 1),
+    ('search_venues_fields', 'GET', lambda r, c: f"/venues/search?search_term={urllib.parse.quote(r.choice(CITIES)[0])}&search_fields=city&search_fields=genres", None, 1),
+    ('edit_venue', 'GET', lambda r, c: f"/venues/{r.randint(1, c['venues'])}/edit", None, 1),
+    ('create_venue_form', 'GET', lambda r, c: '/venues/create', None, 1),
+    ('artists', 'GET', lambda r, c: '/artists', None, 1),
+    ('show_artist', 'GET', lambda r, c: f"/artists/{r.randint(1, c['artists'])}", None, 1),
+    ('search_artists', 'POST', lambda r, c: '/artists/search', lambda r, c: {'search_term': r.choice(['band', 'wild', 'trio', 'moon'])}, 1),
+    ('edit_artist', 'GET', lambda r, c: f"/artists/{r.randint(1, c['artists'])}/edit", None, 1),
+    ('create_artist_form', 'GET', lambda r, c: '/artists/create', None, 1),
+    ('shows', 'GET', lambda r, c: '/shows', None, 1),
+    ('shows_filtered', 'GET', lambda r, c: f"/shows?city={urllib.parse.quote(r.choice(CITIES)[0])}&genre={urllib.parse.quote(r.choice(GENRES))}", None, 1),
+    ('create_show_form', 'GET', lambda r, c: '/shows/create', None, 1),
+    ('api_venue', 'GET', lambda r, c: f"/api/v1/venues/{r.randint(1, c['venues'])}", None, 1),
+    ('api_artist', 'GET', lambda r, c: f"/api/v1/artists/{r.randint(1, c['artists'])}", None, 1),
+    ('api_venues', 'GET', lambda r, c: '/api/v1/venues?fields=id,name', None, 0.05),
+    ('api_artists', 'GET', lambda r, c: '/api/v1/artists?fields=id,name', None, 0.05),
+    ('api_shows', 'GET', lambda r, c: '/api/v1/shows', None, 0.05),
+    ('export_venues', 'GET', lambda r, c: '/export/venues?format=ndjson&gzip=1', None, 0.05),
+    ('metrics', 'GET', lambda r, c: '/metrics', None, 1),
+]
+
+WRITE_ROUTES = [
+    ('create_show', 'POST', lambda r, c: '/shows/create', lambda r, c: {
+        'venue_id': r.randint(1, c['venues']), 'artist_id': r.randint(1, c['artists']),
+        # spread over ten years to the minute, so bookings rarely overlap
+        'start_time': (datetime.now() + timedelta(days=r.randint(1, 3650), minutes=r.randrange(0, 1440, 5))).strftime('%Y-%m-%d %H:%M:%S')}, 1),
+]
+
+
+def percentile(ordered, share):
+    """Nearest-rank percentile of an ordered list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered) + 0.5)) - 1))]
+
+
+def _status_rss(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM on Linux 4.0 and later
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+class InProcessClient(object):
+
+    def __init__(self, app):
+        self.client = app.app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data,
+                                    headers={'Authorization': f'Bearer {EXPORT_TOKEN}'})
+        # read the whole body, streamed or not
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return response.status_code, size
+
+    def peak_rss(self):
+        return _status_rss('self', 'VmHWM')
+
+
+class HTTPClient(object):
+
+    def __init__(self, url, server_pid=None):
+        self.url = url.rstrip('/')
+        self.server_pid = server_pid
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.url + path, data=body, method=method,
+                                         headers={'Authorization': f'Bearer {EXPORT_TOKEN}'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, len(error.read())
+
+    def peak_rss(self):
+        return _status_rss(self.server_pid, 'VmHWM') if self.server_pid else None
+
+
+def run_route(client, route, catalog, requests, concurrency, seed):
+    name, method, path, data, share = route
+    count = max(1, int(requests * share))
+    rnd = random.Random(seed)
+    calls = []
+    for _ in range(count):
+        form = data(rnd, catalog) if data is not None else None
+        calls.append((path(rnd, catalog), form))
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    queue = iter(calls)
+
+    def worker():
+        while True:
+            with lock:
+                call = next(queue, None)
+            if call is None:
+                return
+            started = time.perf_counter()
+            status, size = client.request(method, *call)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+
+    _reset_peak_rss()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'method': method,
+        'requests': count,
+        'errors': len(errors),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'throughput_rps': count / wall,
+        'peak_rss_mb': client.peak_rss(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def catalog_size(app):
+    with app.app.app_context():
+        return {
+            'venues': app.Venue.query.count(),
+            'artists': app.Artist.query.count(),
+            'shows': app.Shows.query.count(),
+        }
+
+
+def compare(before, after):
+    """Print the change of each route between two result files."""
+    print(f"{'route':>22} {'p50 ms':>16} {'p95 ms':>16} {'rps':>16}")
+    for name, new in after['routes'].items():
+        old = before['routes'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'throughput_rps'):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f'{new[key]:>8.1f} {change:>+6.0f}%')
+        print(f'{name:>22} ' + ' '.join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:///bench.db', help='Database of the in-process app.')
+    parser.add_argument('--url', help='Benchmark a running server instead of the app in process.')
+    parser.add_argument('--server-pid', type=int, help='Pid of the server, to read its peak RSS.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--routes', nargs='+', help='Only these routes.')
+    parser.add_argument('--writes', action='store_true', help='Also benchmark the routes that write.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two result files and exit.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+
+    os.environ.setdefault('FYYUR_EXPORT_TOKEN', EXPORT_TOKEN)
+    app = import_app(args.database_url)
+    catalog = catalog_size(app)
+    client = HTTPClient(args.url, args.server_pid) if args.url else InProcessClient(app)
+    routes = ROUTES + (WRITE_ROUTES if args.writes else [])
+    if args.routes:
+        routes = [route for route in routes if route[0] in args.routes]
+
+    results = {
+        'meta': {
+            'started': datetime.utcnow().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'target': args.url or args.database_url,
+            'concurrency': args.concurrency,
+            'catalog': catalog,
+        },
+        'routes': {},
+    }
+    print(f"{'route':>22} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rps':>8} {'rss MB':>7}")
+    for i, route in enumerate(routes):
+        result = run_route(client, route, catalog, args.requests, args.concurrency, args.seed + i)
+        results['routes'][route[0]] = result
+        rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '-'
+        print(f"{route[0]:>22} {result['requests']:>5} {result['errors']:>4} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['throughput_rps']:>8.1f} {rss:>7}")
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Query budgets per route.
+
+Seeds an in-memory SQLite database with a fixed catalog, requests every
+route and fails when one runs more SQL statements or fetches more rows
+than its budget, so a reintroduced N+1 pattern or an unbounded read
+fails `fab test` before it reaches a deploy:
+
+    python -m benchmark.query_budget        # exit status 1 on a regression
+
+Routes showing one venue or artist are requested for the busiest and for
+an idle one, and must run the same number of statements for both. Each
+route is requested once before being measured, so in-process indexes and
+memoized values are warm. The page cache is off in the testing config.
+"""
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmark.dataset import GENRES, artists, import_app, shows, venues
+
+VENUES = 60
+ARTISTS = 150
+SHOWS = 3000
+PAGE = 30
+EXPORT_TOKEN = 'budget'
+
+# name, path (a function of the seeded catalog), statements, rows (a number or a function of the catalog)
+# every page spends 1 statement and row on the conditional GET validators, searches are
+# served from the warm in-process index (on Postgres they take a second statement for the total),
+# the listings read one facet row per genre
+ROUTES = [
+    ('index', lambda c: '/', 0, 0),
+    ('venues', lambda c: '/venues', 3, 1 + PAGE + 1 + len(GENRES)),
+    ('venues filtered', lambda c: '/venues?genre=Jazz&city=New+York&state=NY', 3, 1 + PAGE + 1 + len(GENRES)),
+    ('show_venue busiest', lambda c: f"/venues/{c['busiest_venue']}", 3, lambda c: 2 + c['busiest_venue_shows']),
+    ('show_venue idle', lambda c: f"/venues/{c['idle_venue']}", 3, 2),
+    ('search_venues', lambda c: '/venues/search?search_term=the', 1, PAGE),
+    ('search_venues fields', lambda c: '/venues/search?search_term=new&search_fields=city&search_fields=genres', 1, PAGE),
+    ('edit_venue', lambda c: f"/venues/{c['busiest_venue']}/edit", 1, 1),
+    ('create_venue_form', lambda c: '/venues/create', 0, 0),
+    ('artists', lambda c: '/artists', 3, 1 + PAGE + 1 + len(GENRES)),
+    ('artists filtered', lambda c: '/artists?genre=Rock+n+Roll&genre=Pop', 3, 1 + PAGE + 1 + len(GENRES)),
+    ('show_artist busiest', lambda c: f"/artists/{c['busiest_artist']}", 3, lambda c: 2 + c['busiest_artist_shows']),
+    ('show_artist idle', lambda c: f"/artists/{c['idle_artist']}", 3, 2),
+    ('search_artists', lambda c: '/artists/search?search_term=the', 1, PAGE),
+    ('edit_artist', lambda c: f"/artists/{c['busiest_artist']}/edit", 1, 1),
+    ('create_artist_form', lambda c: '/artists/create', 0, 0),
+    ('shows', lambda c: '/shows', 2, 1 + PAGE + 1),
+    ('shows filtered', lambda c: '/shows?city=New+York&genre=Jazz', 2, 1 + PAGE + 1),
+    ('create_show_form', lambda c: '/shows/create', 0, 0),
+    ('api_venue', lambda c: f"/api/v1/venues/{c['busiest_venue']}", 3, lambda c: 2 + c['busiest_venue_shows']),
+    ('api_artist', lambda c: f"/api/v1/artists/{c['busiest_artist']}", 3, lambda c: 2 + c['busiest_artist_shows']),
+    ('api_venues', lambda c: '/api/v1/venues', 2, 1 + VENUES + 1),
+    ('api_artists', lambda c: '/api/v1/artists', 2, 1 + ARTISTS + 1),
+    ('api_shows', lambda c: '/api/v1/shows', 2, lambda c: 1 + c['upcoming_shows']),
+    ('export_shows', lambda c: '/export/shows', 1, SHOWS),
+    # a refresh of the prefix index: rows changed since the last one, and the row count
+    ('venues_autocomplete', lambda c: '/api/v1/venues/autocomplete?q=the', 2, 1),
+    ('artists_autocomplete', lambda c: '/api/v1/artists/autocomplete?q=b', 2, 1),
+]
+
+
+class Counter(object):
+    """Counts the statements run and the rows fetched from SQLite."""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def reset(self):
+        self.statements = 0
+        self.rows = 0
+
+    def statement(self, *args):
+        self.statements += 1
+
+    def row(self, cursor, row):
+        self.rows += 1
+        return row
+
+
+def seed(app):
+    db = app.db
+    with app.app.app_context():
+        db.create_all()
+        # one venue and one artist more than the shows use, so both have an idle one
+        for model, rows in ((app.Venue, venues(VENUES + 1)), (app.Artist, artists(ARTISTS + 1)),
+                            (app.Shows, shows(SHOWS, VENUES, ARTISTS))):
+            db.session.execute(model.__table__.insert(), list(rows))
+        for model in (app.Venue, app.Artist):
+            app.recount_shows(model)
+            app.recount_genres(model)
+        db.session.commit()
+
+        count = db.func.count(app.Shows.id)
+        venue, venue_shows = db.session.query(app.Shows.venue_id, count).group_by(app.Shows.venue_id) \
+            .order_by(count.desc()).first()
+        artist, artist_shows = db.session.query(app.Shows.artist_id, count).group_by(app.Shows.artist_id) \
+            .order_by(count.desc()).first()
+        return {
+            'busiest_venue': venue,
+            'busiest_venue_shows': venue_shows,
+            'idle_venue': VENUES + 1,
+            'busiest_artist': artist,
+            'busiest_artist_shows': artist_shows,
+            'idle_artist': ARTISTS + 1,
+            'upcoming_shows': app.Shows.query.filter(app.Shows.start_time > datetime.now()).count(),
+        }
+
+
+def measure(client, counter, path):
+    client.get(path, headers={'Authorization': f'Bearer {EXPORT_TOKEN}'}).close()
+    counter.reset()
+    response = client.get(path, headers={'Authorization': f'Bearer {EXPORT_TOKEN}'})
+    # read the body, streamed responses query while it is sent
+    for chunk in response.response:
+        pass
+    response.close()
+    return response.status_code, counter.statements, counter.rows
+
+
+def main(argv=None):
+    os.environ['FYYUR_ENV'] = 'testing'
+    os.environ['FYYUR_EXPORT_TOKEN'] = EXPORT_TOKEN
+    app = import_app('sqlite://')
+    counter = Counter()
+    event.listen(Engine, 'after_cursor_execute', counter.statement)
+    with app.app.app_context():
+        # the in-memory database is one connection, opened here
+        event.listen(app.db.engine, 'connect', lambda connection, record: setattr(connection, 'row_factory', counter.row))
+    catalog = seed(app)
+    client = app.app.test_client()
+
+    failures = []
+    statements_by_page = {}
+    print(f"{'route':>22} {'status':>6} {'stmts':>5} {'budget':>6} {'rows':>6} {'budget':>6}")
+    for name, path, max_statements, max_rows in ROUTES:
+        max_rows = max_rows(catalog) if callable(max_rows) else max_rows
+        status, statements, rows = measure(client, counter, path(catalog))
+        print(f'{name:>22} {status:>6} {statements:>5} {max_statements:>6} {rows:>6} {max_rows:>6}')
+        if status != 200:
+            failures.append(f'{name}: status {status}')
+        if statements > max_statements:
+            failures.append(f'{name}: {statements} statements, budget {max_statements}')
+        if rows > max_rows:
+            failures.append(f'{name}: {rows} rows fetched, budget {max_rows}')
+        statements_by_page.setdefault(name.split()[0], set()).add(statements)
+    for page in ('show_venue', 'show_artist'):
+        if len(statements_by_page[page]) > 1:
+            failures.append(f'{page}: statement count depends on the number of shows')
+
+    if failures:
+        print('\nQuery budget exceeded:\n  ' + '\n  '.join(failures))
+        return 1
+    print('\nAll routes within their query budget.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
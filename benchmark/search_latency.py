@@ -0,0 +1,72 @@
+"""Search latency versus table size.
+
+Times the in-process trigram index from search.py against a sequential
+scan applying the same substring and similarity rules, for growing
+numbers of synthetic names:
+
+    python -m benchmark.search_latency --sizes 1000 10000 100000
+
+On Postgres the same comparison is visible with EXPLAIN ANALYZE on
+"name ILIKE '%term%'" before and after migration 3f6b2c9d1e47.
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+
+from search import SIMILARITY_THRESHOLD, TrigramIndex, similarity, trigrams
+
+Row = namedtuple('Row', 'id name city state genres')
+
+WORDS = ['the', 'blue', 'musical', 'hop', 'dueling', 'pianos', 'park', 'square',
+         'live', 'coffee', 'wild', 'sax', 'band', 'guns', 'roses', 'matt',
+         'quevedo', 'hall', 'club', 'garden', 'street', 'jazz', 'rock', 'soul']
+
+TERMS = ['jazz', 'ro', 'hall club', 'quevdo', 'zzzz']
+
+
+def make_rows(size, seed=0):
+    rnd = random.Random(seed)
+    for id in range(1, size + 1):
+        name = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3)))
+        yield Row(id, f'{name} {id}', 'San Francisco', 'CA', ['Jazz'])
+
+
+def scan(rows, term):
+    """Match every row the way the database does without an index."""
+    grams = trigrams(term)
+    ranks = {}
+    for row in rows:
+        rank = similarity(grams, trigrams(row.name))
+        if term in row.name.lower() or rank >= SIMILARITY_THRESHOLD:
+            ranks[row.id] = rank
+    return ranks
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>8} {'term':>10} {'matches':>8} {'scan ms':>9} {'index ms':>9}")
+    for size in args.sizes:
+        rows = list(make_rows(size))
+        index = TrigramIndex(rows)
+        for term in TERMS:
+            matches = index.lookup(term)
+            assert matches == scan(rows, term)
+            scanned = timed(lambda: scan(rows, term), args.repeat)
+            lookup = timed(lambda: index.lookup(term), args.repeat)
+            print(f'{size:>8} {term:>10} {len(matches):>8} {scanned:>9.2f} {lookup:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""Rendered page cache.
+
+GET views decorated with PageCache.cached keep their rendered body in a
+backend chosen by CACHE_TYPE:
+
+    'simple'      in-process LRU bounded by CACHE_THRESHOLD_BYTES and the timeout
+    'filesystem'  files under CACHE_DIR, shared by every worker of the host,
+                  pruned of expired pages and bounded by CACHE_THRESHOLD_BYTES
+    'redis'       the server at CACHE_REDIS_URL, shared by every host
+    'null'        no caching
+
+Pages are filed under tags such as 'venues' or 'venue:3'. Invalidating a
+tag bumps its version, and since the version is part of every page key,
+all variants of the page (pagination cursors, filters) go stale at once
+without having to be listed. The in-process backend does not see bumps
+made by other workers, so deployments running more than one worker
+should use a shared backend.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, make_response, request, session
+
+
+class LRUCache(object):
+    """Thread safe in-process cache evicting the least recently used pages."""
+
+    def __init__(self, threshold_bytes=64 * 1024 * 1024, default_timeout=300):
+        self.threshold_bytes = threshold_bytes
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires < time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, timeout=None):
+        expires = time.time() + (timeout or self.default_timeout)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (expires, size, value)
+            self._size += size
+            while self._size > self.threshold_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class FileSystemCache(object):
+    """Cache storing each page in its own file, tag versions never expire.
+
+    Pages keyed under a tag version nobody asks for anymore are never read
+    again, so at most every prune_interval seconds a set deletes the expired
+    pages, then the ones closest to expiry while the directory holds more
+    than threshold_bytes of pages.
+    """
+
+    def __init__(self, directory, default_timeout=300, threshold_bytes=None, prune_interval=60):
+        self.directory = directory
+        self.default_timeout = default_timeout
+        self.threshold_bytes = threshold_bytes
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, 'tag-' + digest if key.startswith('tag:') else digest)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.PickleError):
+            return None
+
+    def _write(self, key, entry):
+        # write then rename so readers in other workers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='tmp-')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(entry, file, pickle.HIGHEST_PROTOCOL)
+        if entry[0] != float('inf'):
+            # a page file is modified "at" its expiry, prune reads it from the directory listing
+            os.utime(tmp, (entry[0], entry[0]))
+        os.replace(tmp, self._path(key))
+
+    def get(self, key):
+        entry = self._read(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            self._remove(self._path(key))
+            return None
+        return value
+
+    def set(self, key, value, size, timeout=None):
+        self._write(key, (time.time() + (timeout or self.default_timeout), value))
+        if time.time() >= self._next_prune:
+            self.prune()
+
+    def prune(self):
+        """Delete the expired pages, then the closest to expiry past threshold_bytes."""
+        now = time.time()
+        self._next_prune = now + self.prune_interval
+        pages = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('tag-'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.startswith('tmp-'):
+                # only those left behind by a worker that died while writing
+                if stat.st_mtime < now - self.default_timeout:
+                    self._remove(entry.path)
+            elif stat.st_mtime < now:
+                self._remove(entry.path)
+            else:
+                pages.append((stat.st_mtime, stat.st_size, entry.path))
+        if self.threshold_bytes is None:
+            return
+        size = sum(page[1] for page in pages)
+        pages.sort()
+        while size > self.threshold_bytes and pages:
+            expires, page_size, path = pages.pop(0)
+            self._remove(path)
+            size -= page_size
+
+    def _remove(self, path):
+        # another worker may be pruning too
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def version(self, tag):
+        entry = self._read('tag:' + tag)
+        return entry[1] if entry else 0
+
+    def bump(self, tag):
+        # a new unique version rather than +1 avoids a lost update between workers
+        self._write('tag:' + tag, (float('inf'), '%f-%d' % (time.time(), os.getpid())))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+class RedisCache(object):
+    """Cache kept in Redis, pages expire through the key TTL."""
+
+    def __init__(self, url, default_timeout=300, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, size, timeout=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=int(timeout or self.default_timeout))
+
+    def version(self, tag):
+        return int(self.client.get(self.prefix + 'tag:' + tag) or 0)
+
+    def bump(self, tag):
+        self.client.incr(self.prefix + 'tag:' + tag)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class PageCache(object):
+    """Caches the response body of GET views under invalidation tags."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'simple')
+        timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        if cache_type == 'simple':
+            self.backend = LRUCache(app.config.get('CACHE_THRESHOLD_BYTES', 64 * 1024 * 1024), timeout)
+        elif cache_type == 'filesystem':
+            self.backend = FileSystemCache(app.config['CACHE_DIR'], timeout,
+                                           app.config.get('CACHE_THRESHOLD_BYTES'))
+        elif cache_type == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], timeout)
+        elif cache_type == 'null':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown CACHE_TYPE {cache_type!r}')
+
+    def _key(self, tags):
+        versions = ','.join(f'{tag}={self.backend.version(tag)}' for tag in tags)
+        return f'page:{request.full_path}|{versions}'
+
+    def cached(self, *tags):
+        """Cache the view's 200 responses under tags.
+
+        Tags are formatted with the view arguments, so 'venue:{venue_id}'
+        names the page of one venue. Requests carrying flashed messages
+        are rendered normally so the message is shown exactly once.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if self.backend is None or request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+                key = self._key([tag.format(**kwargs) for tag in tags])
+                hit = self.backend.get(key)
+                if hit is not None:
+                    body, mimetype = hit
+                    return Response(body, mimetype=mimetype)
+                response = make_response(view(**kwargs))
+                if response.status_code != 200 or response.direct_passthrough or session.get('_flashes'):
+                    return response
+                if response.is_streamed:
+                    response.response = self._store_stream(key, response.response, response.mimetype)
+                else:
+                    body = response.get_data()
+                    self.backend.set(key, (body, response.mimetype), len(body))
+                return response
+            return wrapper
+        return decorator
+
+    def _store_stream(self, key, chunks, mimetype):
+        """Pass a streamed body through, caching it once it was sent whole."""
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+                yield chunk
+            body = b''.join(body)
+            self.backend.set(key, (body, mimetype), len(body))
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def invalidate(self, *tags):
+        """Make every page cached under one of tags stale."""
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.bump(tag)
@@ -0,0 +1,54 @@
+"""Conditional GET for pages whose freshness can be told without rendering.
+
+A view decorated with conditional(validators) first calls
+validators(**view_args), which returns None when the page cannot be
+validated (e.g. unknown id) or a (last_modified, state) pair, state being
+any values whose change means the page changed. The state is hashed into
+the ETag. A request whose If-None-Match / If-Modified-Since still matches
+gets a 304 without the view (or the page cache behind it) being called.
+"""
+import functools
+import hashlib
+from datetime import timezone
+
+from flask import Response, make_response, request, session
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validators):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(**kwargs)
+            validated = validators(**kwargs)
+            if validated is None:
+                return view(**kwargs)
+            last_modified, state = validated
+            etag = hashlib.sha1(repr(state).encode()).hexdigest()
+            if last_modified is not None:
+                # stored as naive UTC, HTTP dates have a one second resolution
+                last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # let browsers and the CDN keep the page but revalidate it on every use
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+"""Bulk export of venues, artists and shows.
+
+Rows are read in id order through a server-side cursor and encoded as CSV
+or NDJSON chunk by chunk, optionally gzipped on the fly, so an export of
+any size runs in constant memory. The columns are those of the table and
+the values are written the way importer.py reads them back, which makes
+an export a valid `flask import` file.
+"""
+import csv
+import io
+import zlib
+
+from jsonstream import dumps
+
+FORMATS = ('csv', 'ndjson')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ','.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def rows(session, model, batch=1000):
+    """Return the rows of model's table in id order, read through a server-side cursor."""
+    table = model.__table__
+    query = session.query(*table.columns).order_by(table.c.id)
+    return query.execution_options(stream_results=True).yield_per(batch)
+
+
+def encode_csv(columns, rows):
+    """Yield the CSV text of rows in chunks, the header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(columns, rows):
+    """Yield rows as one JSON object per line, in chunks."""
+    chunk = []
+    size = 0
+    for row in rows:
+        line = dumps(dict(zip(columns, row))) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    yield b''.join(chunk)
+
+
+def compress(chunks, level=6):
+    """Gzip a stream of byte chunks as it goes."""
+    # wbits 16 + MAX_WBITS writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(session, model, format='csv', gzipped=False):
+    """Yield the export of model's table as bytes."""
+    columns = [column.key for column in model.__table__.columns]
+    encode = encode_csv if format == 'csv' else encode_ndjson
+    chunks = encode(columns, rows(session, model))
+    return compress(chunks) if gzipped else chunks
+
+
+def filename(kind, format, gzipped=False):
+    return f'{kind}.{format}' + ('.gz' if gzipped else '')
@@ -0,0 +1,70 @@
+"""Template filters.
+
+format_datetime is applied to every show tile, so it avoids the work the
+plain babel call repeats: datetimes are taken as they come from the
+database instead of being parsed back from ISO strings, the compiled
+Babel patterns and Locale objects are kept, and formatted results are
+memoized since many shows share a start time.
+"""
+import functools
+from datetime import datetime, timezone
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+# the app's names for its patterns, other values are used as Babel patterns
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Babel's own formats, which depend on the locale rather than a pattern
+LOCALE_FORMATS = ('long', 'short')
+
+MEMO_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def _pattern(format):
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@functools.lru_cache(maxsize=None)
+def _locale(locale):
+    return Locale.parse(locale)
+
+
+def to_datetime(value):
+    """Return value as a datetime, parsing strings."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return dateutil.parser.parse(value)
+
+
+def _format(value, format, locale):
+    if value.tzinfo is None:
+        # naive times are UTC, as Babel assumes
+        value = value.replace(tzinfo=timezone.utc)
+    if format in LOCALE_FORMATS:
+        return babel.dates.format_datetime(value, format, locale=_locale(locale))
+    return _pattern(format).apply(value, _locale(locale))
+
+
+_format_memoized = functools.lru_cache(maxsize=MEMO_SIZE)(_format)
+
+
+def format_datetime(value, format='medium', locale=None, memoize=True):
+    """Format value, a datetime or a string holding one, with format.
+
+    format is 'full', 'medium', 'long', 'short' or a Babel pattern; locale
+    defaults to the system time locale.
+    """
+    value = to_datetime(value)
+    locale = locale or babel.dates.LC_TIME
+    if memoize:
+        return _format_memoized(value, format, locale)
+    return _format(value, format, locale)
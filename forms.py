@@ -1,17 +1,65 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from flask import current_app
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField,TextAreaField
-from wtforms.validators import DataRequired, AnyOf, URL, StopValidation
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField,BooleanField,TextAreaField,IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, StopValidation, ValidationError, Optional, NumberRange
+
+GENRES = [
+    'Alternative',
+    'Blues',
+    'Classical',
+    'Country',
+    'Electronic',
+    'Folk',
+    'Funk',
+    'Hip-Hop',
+    'Heavy Metal',
+    'Instrumental',
+    'Jazz',
+    'Musical Theatre',
+    'Pop',
+    'Punk',
+    'R&B',
+    'Reggae',
+    'Rock n Roll',
+    'Soul',
+    'Other',
+]
 
 def SizeValidator(min=-1, max=-1):
     message = 'Must be between %d and %d' % (min, max)
     def _length(form, field):
-        l = field.data
+        l = len(field.data) if isinstance(field.data, (list, tuple)) else field.data
         if l < min or max != -1 and l > max:
             raise StopValidation(message)
 
     return _length
 
+#the longest show, which bounds the range scanned for double bookings
+MAX_SHOW_HOURS = 24
+
+def EndTimeValidator(max_hours=MAX_SHOW_HOURS):
+    message = 'Must be after the start time and at most %d hours later' % max_hours
+    def _end_time(form, field):
+        start = form.start_time.data
+        if field.data is None or start is None:
+            return
+        try:
+            latest = start + timedelta(hours=max_hours)
+        except OverflowError:
+            latest = datetime.max
+        if not start < field.data <= latest:
+            raise ValidationError(message)
+
+    return _end_time
+
+def BatchLimitValidator():
+    # SHOW_BATCH_LIMIT is only known once the app is configured
+    def _batch_limit(form, field):
+        NumberRange(min=1, max=current_app.config['SHOW_BATCH_LIMIT'])(form, field)
+
+    return _batch_limit
+
 class ShowForm(Form):
     artist_id = StringField(
         'artist_id', validators=[DataRequired()]
@@ -22,7 +70,42 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        default= datetime.today(),
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M']
+    )
+    # blank for a show of the default duration
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional(), EndTimeValidator()],
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M']
+    )
+
+class ShowBatchForm(Form):
+    # a tour: one "artist_id, venue_id, start_time" line per show
+    shows = TextAreaField(
+        'shows'
+    )
+    # or a residency: one artist at one venue, repeating from a first show
+    artist_id = StringField(
+        'artist_id'
+    )
+    venue_id = StringField(
+        'venue_id'
+    )
+    first_start_time = DateTimeField(
+        'first_start_time', validators=[Optional()],
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M']
+    )
+    repeat = SelectField(
+        'repeat',
+        choices=[
+            ('weekly', 'Weekly'),
+            ('daily', 'Daily'),
+            ('monthly', 'Monthly'),
+        ]
+    )
+    occurrences = IntegerField(
+        'occurrences', validators=[Optional(), BatchLimitValidator()]
     )
 
 class VenueForm(Form):
@@ -96,28 +179,8 @@ class VenueForm(Form):
     )
     genres = SelectMultipleField(
         # TODO implement enum restriction
-        'genres', validators=[SizeValidator(4),DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        'genres', validators=[SizeValidator(1, 4),DataRequired()],
+        choices=[(genre, genre) for genre in GENRES]
     )
     facebook_link = StringField(
         'facebook_link', validators=[DataRequired(), URL()]
@@ -193,28 +256,8 @@ class ArtistForm(Form):
         'phone', validators=[DataRequired()]
     )
     genres = SelectMultipleField(
-        'genres', validators=[DataRequired(),SizeValidator(4)],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        'genres', validators=[DataRequired(),SizeValidator(1, 4)],
+        choices=[(genre, genre) for genre in GENRES]
     )
     facebook_link = StringField(
         'facebook_link', validators=[DataRequired(), URL()]
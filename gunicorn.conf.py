@@ -0,0 +1,49 @@
+"""Gunicorn settings for running Fyyur in production.
+
+    FYYUR_ENV=production FYYUR_SECRET_KEY=... DATABASE_URL=... gunicorn app:app
+
+gunicorn picks this file up from the working directory. Every worker
+process opens its own database pool of FYYUR_DB_POOL_SIZE connections
+(the thread count by default) plus FYYUR_DB_MAX_OVERFLOW, so keep
+workers * (pool size + overflow) under the max_connections of Postgres.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+
+# CPU bound rendering scales with processes, waits on the database with threads
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# longer than the Postgres statement_timeout, so slow queries fail before the worker is killed
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then to bound the growth of in-process caches
+max_requests = 2000
+max_requests_jitter = 200
+
+# the app is imported after the fork, so no worker inherits another's database connections
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+
+# With PROMETHEUS_MULTIPROC_DIR set, the workers keep their metrics in files there
+# that /metrics adds up; start from an empty directory and retire the files of dead workers.
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,297 @@
+"""Bulk loading of venues, artists and shows.
+
+`flask import venues venues.csv` reads CSV or newline delimited JSON,
+checks each record with the form the site uses to create one row, and
+inserts the valid records in batches: COPY on Postgres (psycopg2),
+executemany otherwise.
+
+Each batch is committed on its own and the progress lines name the last
+line committed, so an interrupted import resumes with --start-line.
+Invalid records are reported, and written to the rejects file, without
+stopping the import. A batch the database refuses is retried row by row
+to find the offending records.
+"""
+import csv
+import io
+import itertools
+import json
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import func
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+from wtforms import DateTimeField, SelectMultipleField
+
+from filters import to_datetime
+
+FORMATS = ('csv', 'ndjson')
+
+# columns filled in by the importer rather than read from the records
+MANAGED_COLUMNS = ('updated_at',)
+
+
+def guess_format(filename):
+    return 'csv' if (filename or '').lower().endswith('.csv') else 'ndjson'
+
+
+def read_records(file, format):
+    """Yield (line number, record, error) for each record of file."""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, None, f'invalid JSON: {error}'
+            continue
+        if isinstance(record, dict):
+            yield number, record, None
+        else:
+            yield number, None, 'not a JSON object'
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def _formdata(form, record):
+    """Return record as the form data the browser would have posted."""
+    data = MultiDict()
+    for name, field in form._fields.items():
+        value = record.get(name)
+        if value is None or value == '':
+            continue
+        if isinstance(field, SelectMultipleField):
+            for item in _split(value):
+                data.add(name, item)
+            continue
+        if isinstance(field, DateTimeField) and isinstance(value, str):
+            formats = field.format if isinstance(field.format, (list, tuple)) else [field.format]
+            try:
+                value = to_datetime(value).strftime(formats[0])
+            except (ValueError, OverflowError):
+                pass
+        data.add(name, str(value))
+    return data
+
+
+def _coerce(column, value):
+    if value is None or value == '':
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is bool and not isinstance(value, bool):
+        return str(value).strip().lower() in ('1', 't', 'true', 'y', 'yes', 'on')
+    if python_type is int and not isinstance(value, int):
+        return int(value)
+    if python_type is datetime and not isinstance(value, datetime):
+        return to_datetime(value)
+    if python_type is list and not isinstance(value, list):
+        return _split(value)
+    return value
+
+
+def _copy_value(value):
+    """Encode value for COPY ... FROM STDIN in text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        value = value.isoformat(' ')
+    elif isinstance(value, list):
+        value = '{%s}' % ','.join('"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class _DefaultContext(object):
+    """The part of an execution context that column defaults read: the row being inserted."""
+
+    def __init__(self, row):
+        self.row = row
+
+    def get_current_parameters(self, isolate_multiinsert_groups=True):
+        return self.row
+
+
+def _default(column, row):
+    """Return the Python side default of column for row, None without one."""
+    default = column.default
+    if default is None:
+        return None
+    if default.is_scalar:
+        return default.arg
+    if default.is_callable:
+        # like the insert would, with the values of the columns before it
+        return default.arg(_DefaultContext(row))
+    return None
+
+
+class ImportStats(object):
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.last_line = None
+        self.elapsed = 0.0
+        # referenced ids per foreign key column, for cache invalidation
+        self.references = {}
+
+    @property
+    def rate(self):
+        return self.inserted / self.elapsed if self.elapsed else 0.0
+
+
+class Importer(object):
+    """Validates records with form_class and inserts them into the table of model."""
+
+    def __init__(self, session, model, form_class, batch_size=5000, report=click.echo):
+        self.session = session
+        self.table = model.__table__
+        self.form = form_class(formdata=None, meta={'csrf': False})
+        self.batch_size = batch_size
+        self.report = report
+        self.columns = [column for column in self.table.columns if column.key not in MANAGED_COLUMNS]
+        self.foreign_keys = [(fk.parent, fk.column) for fk in self.table.foreign_keys]
+        self.no_defaults = dict((name, None) for name in self.form._fields)
+
+    def _row(self, record):
+        """Return the table row for record, or raise ValueError with the form errors."""
+        # a record gives every value itself, the defaults of the form fields are not applied
+        self.form.process(_formdata(self.form, record), **self.no_defaults)
+        if not self.form.validate():
+            raise ValueError('; '.join(f"{name}: {' '.join(errors)}" for name, errors in self.form.errors.items()))
+        row = {}
+        for column in self.columns:
+            if column.key in self.form._fields:
+                value = self.form._fields[column.key].data
+            elif record.get(column.key) not in (None, ''):
+                value = record[column.key]
+            elif column.primary_key:
+                continue
+            else:
+                value = None
+            try:
+                value = _coerce(column, value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{column.key}: not a valid {column.type}')
+            try:
+                row[column.key] = value if value is not None else _default(column, row)
+            except OverflowError:
+                raise ValueError(f'{column.key}: out of range')
+        row['updated_at'] = datetime.utcnow()
+        return row
+
+    def _missing_references(self, rows):
+        """Return the rows pointing at rows that do not exist, with the reason."""
+        missing = {}
+        for column, target in self.foreign_keys:
+            ids = set(row[column.key] for line, row in rows if row.get(column.key) is not None)
+            found = set(value for value, in self.session.query(target).filter(target.in_(ids))) if ids else set()
+            for line, row in rows:
+                value = row.get(column.key)
+                if value is not None and value not in found:
+                    missing.setdefault(line, f'{column.key}: {target.table.name} {value} does not exist')
+        return missing
+
+    def _insert(self, rows):
+        connection = self.session.connection()
+        # executemany needs the same columns in every row, ids may be given for some rows only
+        for keys, group in itertools.groupby(rows, key=lambda row: tuple(row)):
+            group = list(group)
+            if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+                buffer = io.StringIO()
+                for row in group:
+                    buffer.write('\t'.join(_copy_value(row[key]) for key in keys) + '\n')
+                buffer.seek(0)
+                columns = ', '.join(f'"{key}"' for key in keys)
+                cursor = connection.connection.cursor()
+                cursor.copy_expert(f'COPY "{self.table.name}" ({columns}) FROM STDIN', buffer)
+            else:
+                self.session.execute(self.table.insert(), group)
+
+    def _reject(self, stats, rejects, line, record, error):
+        stats.rejected += 1
+        self.report(f'line {line}: {error}', err=True)
+        if rejects is not None:
+            rejects.write(json.dumps({'line': line, 'error': error, 'record': record}, default=str) + '\n')
+
+    def _flush(self, batch, stats, rejects):
+        rows = [(line, row) for line, record, row in batch]
+        missing = self._missing_references(rows)
+        for line, record, row in batch:
+            if line in missing:
+                self._reject(stats, rejects, line, record, missing[line])
+        batch = [entry for entry in batch if entry[0] not in missing]
+        try:
+            self._insert([row for line, record, row in batch])
+            self.session.commit()
+            done = batch
+        except DBAPIError:
+            self.session.rollback()
+            done = []
+            for entry in batch:
+                line, record, row = entry
+                try:
+                    self._insert([row])
+                    self.session.commit()
+                    done.append(entry)
+                except DBAPIError as error:
+                    self.session.rollback()
+                    self._reject(stats, rejects, line, record, str(error.orig).strip())
+        stats.inserted += len(done)
+        for column, target in self.foreign_keys:
+            stats.references.setdefault(column.key, set()).update(row[column.key] for line, record, row in done)
+
+    def _reset_sequence(self):
+        """Move the id sequence past the ids given by the records."""
+        if self.session.get_bind().dialect.name != 'postgresql':
+            return
+        sequence = func.pg_get_serial_sequence(f'"{self.table.name}"', 'id')
+        self.session.query(func.setval(sequence, func.coalesce(func.max(self.table.c.id), 1))).scalar()
+        self.session.commit()
+
+    def run(self, records, start_line=1, rejects=None):
+        """Import records as yielded by read_records, skipping the lines before start_line."""
+        stats = ImportStats()
+        started = time.perf_counter()
+        explicit_ids = False
+        batch = []
+        for line, record, error in records:
+            if line < start_line:
+                continue
+            stats.read += 1
+            stats.last_line = line
+            if error is None:
+                try:
+                    row = self._row(record)
+                except ValueError as invalid:
+                    error = str(invalid)
+            if error is not None:
+                self._reject(stats, rejects, line, record, error)
+                continue
+            explicit_ids = explicit_ids or 'id' in row
+            batch.append((line, record, row))
+            if len(batch) >= self.batch_size:
+                self._flush(batch, stats, rejects)
+                batch = []
+                stats.elapsed = time.perf_counter() - started
+                self.report(f'{stats.inserted} rows, {stats.rate:.0f} rows/s, committed through line {line}')
+        if batch:
+            self._flush(batch, stats, rejects)
+        if explicit_ids:
+            self._reset_sequence()
+        stats.elapsed = time.perf_counter() - started
+        return stats
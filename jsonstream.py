@@ -0,0 +1,61 @@
+"""JSON encoding for the read-only API.
+
+Uses orjson when it is installed and the json module otherwise. Lists
+are streamed: rows are read from a server-side cursor in batches and sent
+in chunks of about CHUNK_SIZE bytes, so memory does not grow with the
+length of the list.
+"""
+import json
+from datetime import date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(value):
+    """Encode value to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+
+def parse_fields(value):
+    """Return the set of fields asked for by a ?fields=a,b parameter, None for all."""
+    fields = set(field.strip() for field in (value or '').split(',') if field.strip())
+    return fields or None
+
+
+def select(record, fields):
+    """Return record trimmed to fields."""
+    if fields is None:
+        return record
+    return dict((key, value) for key, value in record.items() if key in fields)
+
+
+def stream_rows(query, fields=None, batch=1000):
+    """Yield the rows of query as one JSON array, encoded chunk by chunk."""
+    rows = query.execution_options(stream_results=True).yield_per(batch)
+    buffer = [b'[']
+    size = 1
+    for i, row in enumerate(rows):
+        item = dumps(select(row._asdict(), fields))
+        if i:
+            buffer.append(b',')
+        buffer.append(item)
+        size += len(item) + 1
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(b']')
+    yield b''.join(buffer)
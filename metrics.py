@@ -0,0 +1,112 @@
+"""Prometheus metrics.
+
+Metrics(app) times every request and serves /metrics in the Prometheus
+text format:
+
+    fyyur_request_duration_seconds{endpoint, method}      histogram
+    fyyur_requests_total{endpoint, method, status}        counter
+    fyyur_request_db_seconds{endpoint}                    histogram
+    fyyur_request_db_queries{endpoint}                    histogram
+    fyyur_template_render_seconds{template}               histogram
+
+Request times run until the response is fully sent, streamed bodies
+included. Database figures come from querystats, so they need
+QUERY_STATS. Templates rendered with stream_template are timed over the
+whole stream, which includes reading their rows.
+
+Under gunicorn each worker counts on its own. When PROMETHEUS_MULTIPROC_DIR
+names a directory, prometheus_client keeps the values in memory mapped
+files there and /metrics adds up those of every worker; gunicorn.conf.py
+empties it at start up and retires the files of dead workers.
+
+The prometheus_client package is required, without it no metrics are kept
+and /metrics does not exist.
+"""
+import os
+import time
+
+from flask import Response, before_render_template, g, request, template_rendered
+
+from querystats import QueryStats
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Metrics(object):
+    """Records request, database and template timings per endpoint."""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('METRICS', True):
+            return
+        try:
+            import prometheus_client
+        except ImportError:
+            app.logger.info('prometheus_client is not installed, metrics are off')
+            return
+        self.client = prometheus_client
+        self.enabled = True
+        self.requests = prometheus_client.Counter(
+            'fyyur_requests_total', 'Requests answered', ['endpoint', 'method', 'status'])
+        self.latency = prometheus_client.Histogram(
+            'fyyur_request_duration_seconds', 'Time to answer a request', ['endpoint', 'method'])
+        self.db_time = prometheus_client.Histogram(
+            'fyyur_request_db_seconds', 'Time spent in the database per request', ['endpoint'])
+        self.db_queries = prometheus_client.Histogram(
+            'fyyur_request_db_queries', 'SQL statements per request', ['endpoint'], buckets=QUERY_BUCKETS)
+        self.render_time = prometheus_client.Histogram(
+            'fyyur_template_render_seconds', 'Time to render a template', ['template'])
+
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.serve)
+
+    @staticmethod
+    def _endpoint():
+        # unmatched urls share one label so scanners cannot grow the series
+        return request.endpoint or '<unmatched>'
+
+    def _start(self):
+        g._metrics_start = time.perf_counter()
+
+    def _record_status(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _finish(self, exception=None):
+        started = g.pop('_metrics_start', None)
+        if started is None:
+            return
+        endpoint = self._endpoint()
+        status = 500 if exception is not None else g.pop('_metrics_status', 500)
+        self.latency.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        self.requests.labels(endpoint, request.method, str(status)).inc()
+        stats = QueryStats.current()
+        if stats is not None:
+            self.db_time.labels(endpoint).observe(stats.duration)
+            self.db_queries.labels(endpoint).observe(stats.count)
+
+    def _render_started(self, sender, template, context, **extra):
+        g.setdefault('_metrics_renders', []).append(time.perf_counter())
+
+    def _render_finished(self, sender, template, context, **extra):
+        renders = g.get('_metrics_renders')
+        if renders:
+            self.render_time.labels(template.name or '<string>').observe(time.perf_counter() - renders.pop())
+
+    def serve(self):
+        client = self.client
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            from prometheus_client import multiprocess
+            registry = client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = client.REGISTRY
+        return Response(client.generate_latest(registry), mimetype=client.CONTENT_TYPE_LATEST)
@@ -0,0 +1,24 @@
+"""index shows on start time
+
+Revision ID: 5a8e1f3c7b90
+Revises: 3f6b2c9d1e47
+Create Date: 2026-10-18 11:02:17.304518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8e1f3c7b90'
+down_revision = '3f6b2c9d1e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time', 'Show', ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time', table_name='Show')
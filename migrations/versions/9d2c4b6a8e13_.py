@@ -0,0 +1,47 @@
+"""show relationships through Show foreign keys
+
+Revision ID: 9d2c4b6a8e13
+Revises: 5a8e1f3c7b90
+Create Date: 2026-10-18 12:26:51.770925
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c4b6a8e13'
+down_revision = '5a8e1f3c7b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the association rows are authoritative for the relationships, copy them onto the show
+    op.execute('UPDATE "Show" SET venue_id = items.venue_id FROM venue_show_items AS items WHERE items.show_id = "Show".id')
+    op.execute('UPDATE "Show" SET artist_id = items.artist_id FROM artist_show_items AS items WHERE items.show_id = "Show".id')
+    op.drop_table('venue_show_items')
+    op.drop_table('artist_show_items')
+    op.create_index('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='Show')
+    op.create_table('artist_show_items',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['show_id'], ['Show.id'], ),
+    sa.PrimaryKeyConstraint('show_id', 'artist_id')
+    )
+    op.create_table('venue_show_items',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['show_id'], ['Show.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('show_id', 'venue_id')
+    )
+    op.execute('INSERT INTO artist_show_items (show_id, artist_id) SELECT id, artist_id FROM "Show"')
+    op.execute('INSERT INTO venue_show_items (show_id, venue_id) SELECT id, venue_id FROM "Show"')
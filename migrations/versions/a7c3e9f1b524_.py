@@ -0,0 +1,49 @@
+"""genre browsing: GIN indexes on genres, genre facet counts
+
+Revision ID: a7c3e9f1b524
+Revises: f2b8d4e6a913
+Create Date: 2026-10-18 18:40:12.318845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b524'
+down_revision = 'f2b8d4e6a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'], unique=False)
+    op.create_index('ix_artist_state_city', 'Artist', ['state', 'city'], unique=False)
+    op.create_table('GenreFacet',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('genre', sa.String(), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'genre', 'state', 'city', name='uq_genre_facet')
+    )
+    # a genre listed twice by a row counts once, like count_genres does
+    for table in ('Venue', 'Artist'):
+        op.execute(f'''
+            INSERT INTO "GenreFacet" (kind, genre, state, city, count)
+            SELECT '{table}', genre, coalesce(state, ''), coalesce(city, ''), count(*)
+            FROM (SELECT DISTINCT id, state, city, unnest(genres) AS genre FROM "{table}") AS listed
+            GROUP BY genre, coalesce(state, ''), coalesce(city, '')
+        ''')
+
+
+def downgrade():
+    op.drop_table('GenreFacet')
+    op.drop_index('ix_artist_state_city', table_name='Artist')
+    op.drop_index('ix_venue_state_city', table_name='Venue')
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
@@ -0,0 +1,29 @@
+"""table versions counting deletes, for the HTTP validators
+
+Revision ID: b3d9f5a7c160
+Revises: a7c3e9f1b524
+Create Date: 2026-10-19 10:12:44.607321
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d9f5a7c160'
+down_revision = 'a7c3e9f1b524'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table = op.create_table('TableVersion',
+        sa.Column('name', sa.String(length=30), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table, [{'name': name, 'version': 0} for name in ('Venue', 'Artist', 'Show')])
+
+
+def downgrade():
+    op.drop_table('TableVersion')
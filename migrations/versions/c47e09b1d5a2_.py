@@ -0,0 +1,34 @@
+"""updated_at on venues, artists and shows
+
+Revision ID: c47e09b1d5a2
+Revises: 9d2c4b6a8e13
+Create Date: 2026-10-18 13:48:05.166372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e09b1d5a2'
+down_revision = '9d2c4b6a8e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as modified now, in UTC like the application writes them
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text("timezone('utc', now())")))
+        op.alter_column(table, 'updated_at', server_default=None)
+    op.create_index('ix_venue_updated_at', 'Venue', ['updated_at'], unique=False)
+    op.create_index('ix_artist_updated_at', 'Artist', ['updated_at'], unique=False)
+    op.create_index('ix_show_updated_at', 'Show', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_updated_at', table_name='Show')
+    op.drop_index('ix_artist_updated_at', table_name='Artist')
+    op.drop_index('ix_venue_updated_at', table_name='Venue')
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,44 @@
+"""show counters on venues and artists
+
+Revision ID: e5f1a7c3d208
+Revises: c47e09b1d5a2
+Create Date: 2026-10-18 16:02:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f1a7c3d208'
+down_revision = 'c47e09b1d5a2'
+branch_labels = None
+depends_on = None
+
+OWNERS = (
+    ('Venue', 'venue_id', 'ix_venue_next_show_at'),
+    ('Artist', 'artist_id', 'ix_artist_next_show_at'),
+)
+
+
+def upgrade():
+    for table, owner, index in OWNERS:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index(index, table, ['next_show_at'], unique=False)
+        # show times are naive local times, like datetime.now() in the application
+        op.execute(f'''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{owner} = "{table}".id AND "Show".start_time > LOCALTIMESTAMP),
+                past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{owner} = "{table}".id AND "Show".start_time <= LOCALTIMESTAMP),
+                next_show_at = (SELECT min(start_time) FROM "Show" WHERE "Show".{owner} = "{table}".id AND "Show".start_time > LOCALTIMESTAMP)
+        ''')
+
+
+def downgrade():
+    for table, owner, index in reversed(OWNERS):
+        op.drop_index(index, table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,46 @@
+"""end time of shows, no overlapping shows at a venue
+
+Revision ID: f2b8d4e6a913
+Revises: e5f1a7c3d208
+Create Date: 2026-10-18 17:21:09.846152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4e6a913'
+down_revision = 'e5f1a7c3d208'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the gist index of the exclusion constraint compares venue ids with =
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows last the default two hours, cut short by the next show of their venue
+    # so the constraint can be built; shows listed twice at the same time end as they start
+    op.execute('''
+        UPDATE "Show" SET end_time = LEAST("Show".start_time + interval '120 minutes', next.start_time)
+        FROM (
+            SELECT id, lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS start_time
+            FROM "Show"
+        ) AS next
+        WHERE next.id = "Show".id
+    ''')
+    op.alter_column('Show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_show_end_time', 'Show', 'end_time >= start_time')
+    op.create_exclude_constraint(
+        'ex_show_venue_time', 'Show',
+        ('venue_id', '='),
+        (sa.text('tsrange(start_time, end_time)'), '&&'),
+        using='gist',
+    )
+
+
+def downgrade():
+    op.drop_constraint('ex_show_venue_time', 'Show')
+    op.drop_constraint('ck_show_end_time', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,211 @@
+"""Keyset pagination for the listing and search pages.
+
+A page is addressed by the sort key of its boundary row instead of an
+offset, so fetching page 1000 costs the same index range scan as page 1.
+Cursors are the boundary key encoded as urlsafe base64 JSON.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class Page(object):
+    """One page of rows with the cursors of its neighbours.
+
+    next_cursor / prev_cursor are None when there is nothing in that
+    direction; total is only filled in by callers that know it.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _matches(value, python_type):
+    """Whether a decoded cursor value can be compared with keys of python_type."""
+    if value is None:
+        return False
+    if python_type is None:
+        return True
+    if isinstance(value, bool):
+        return python_type is bool
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
+def decode_cursor(cursor, order=None, types=None):
+    """Return the key values of cursor, or None if it is not a valid cursor.
+
+    Each value must fit the python type of its column in order, or its
+    entry of types for keys sorted in memory, so that a forged cursor is
+    ignored instead of failing the query.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    if order is not None:
+        types = [_python_type(column) for column, descending in order]
+    if types is not None and len(values) != len(types):
+        return None
+    for i, python_type in enumerate(types or []):
+        if python_type is datetime and isinstance(values[i], str):
+            try:
+                values[i] = datetime.fromisoformat(values[i])
+            except ValueError:
+                return None
+        elif not _matches(values[i], python_type):
+            return None
+    return values
+
+
+def order_clauses(order):
+    """Return the ORDER BY clauses of order."""
+    return [column.desc() if descending else column for column, descending in order]
+
+
+def _beyond(order, values):
+    """Return the condition selecting the rows sorted after values."""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [order[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*(equal + [step])))
+    # the redundant bound on the first column lets the planner use its index
+    first, descending = order[0]
+    bound = first <= values[0] if descending else first >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def _key(row, order):
+    return [getattr(row, column.key) for column, descending in order]
+
+
+def paginate(query, order, after=None, before=None, size=30):
+    """Return the Page of query following cursor after or preceding cursor before.
+
+    order is a list of (column, descending) pairs that must end in a unique
+    column; every column must be selected by query under its own key.
+    """
+    flip = [(column, not descending) for column, descending in order]
+    values = decode_cursor(before, order) if before else None
+    if values is not None:
+        rows = query.filter(_beyond(flip, values)).order_by(*order_clauses(flip)).limit(size + 1).all()
+        items = rows[:size][::-1]
+        return Page(
+            items,
+            next_cursor=encode_cursor(_key(items[-1], order)) if items else None,
+            prev_cursor=encode_cursor(_key(items[0], order)) if len(rows) > size else None,
+        )
+
+    values = decode_cursor(after, order) if after else None
+    if values is not None:
+        query = query.filter(_beyond(order, values))
+    rows = query.order_by(*order_clauses(order)).limit(size + 1).all()
+    items = rows[:size]
+    return Page(
+        items,
+        next_cursor=encode_cursor(_key(items[-1], order)) if len(rows) > size else None,
+        prev_cursor=encode_cursor(_key(items[0], order)) if values is not None and items else None,
+    )
+
+
+class StreamedPage(Page):
+    """A Page whose rows are read from the database while it is iterated.
+
+    It can be iterated once; the cursors are known when the iteration is
+    over, which suits templates that render the pager below the rows.
+    """
+
+    def __init__(self, rows, order, size, after):
+        Page.__init__(self, None)
+        self._rows = rows
+        self._order = order
+        self._size = size
+        self._after = after
+
+    def __iter__(self):
+        first = last = None
+        count = 0
+        for row in self._rows:
+            if count == self._size:
+                self.next_cursor = encode_cursor(_key(last, self._order))
+                break
+            if first is None:
+                first = row
+            last = row
+            count += 1
+            yield row
+        if self._after and first is not None:
+            self.prev_cursor = encode_cursor(_key(first, self._order))
+
+
+def paginate_stream(query, order, after=None, before=None, size=30, batch=100):
+    """Like paginate, but the returned page reads its rows through a server-side cursor.
+
+    Pages reached backwards have to be reversed, those are read whole.
+    """
+    if before and decode_cursor(before, order) is not None:
+        return paginate(query, order, after, before, size)
+    values = decode_cursor(after, order) if after else None
+    if values is not None:
+        query = query.filter(_beyond(order, values))
+    rows = query.order_by(*order_clauses(order)).limit(size + 1)
+    rows = rows.execution_options(stream_results=True).yield_per(min(batch, size + 1))
+    return StreamedPage(rows, order, size, values is not None)
+
+
+def paginate_sorted(keys, types, after=None, before=None, size=30):
+    """Return the Page of an in-memory, already sorted list of keys.
+
+    Each key is a list whose order matches the cursors handed out, the
+    page items are the keys themselves; types lists the type of each of
+    their values.
+    """
+    values = decode_cursor(before, types=types) if before else None
+    if values is not None:
+        end = bisect_left(keys, values)
+        start = max(end - size, 0)
+        items = keys[start:end]
+        return Page(
+            items,
+            next_cursor=encode_cursor(items[-1]) if items else None,
+            prev_cursor=encode_cursor(items[0]) if start > 0 else None,
+            total=len(keys),
+        )
+
+    values = decode_cursor(after, types=types) if after else None
+    start = bisect_right(keys, values) if values is not None else 0
+    items = keys[start:start + size]
+    return Page(
+        items,
+        next_cursor=encode_cursor(items[-1]) if start + size < len(keys) else None,
+        prev_cursor=encode_cursor(items[0]) if start > 0 and items else None,
+        total=len(keys),
+    )
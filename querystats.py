@@ -0,0 +1,115 @@
+"""Per request SQL statistics.
+
+QueryStats listens to the statements SQLAlchemy sends and keeps, for the
+current request, how many were run, the time spent in the database and
+how often each statement was repeated. A request running more than
+QUERY_COUNT_WARNING statements, spending more than QUERY_TIME_WARNING_MS
+in the database or running one statement QUERY_REPEAT_WARNING times (the
+mark of an N+1 pattern) is logged as a warning when it ends.
+
+With QUERY_STATS_HEADERS, on by default in debug mode, responses carry
+X-Query-Count and a Server-Timing entry that browser dev tools display.
+Streamed responses run part of their queries after the headers are sent;
+those count towards the warning but not the headers.
+"""
+import re
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# a list of placeholders, as expanded for IN (...), whatever its length
+_PLACEHOLDERS = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+
+
+def normalize(statement):
+    """Return statement with its whitespace and IN lists collapsed."""
+    return _PLACEHOLDERS.sub('(?)', ' '.join(statement.split()))
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[normalize(statement)] += 1
+
+    def repeated(self, times):
+        """Return the (statement, count) pairs run at least times, most repeated first."""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= times]
+
+
+class QueryStats(object):
+    """Counts the SQL statements of each request and warns about the costly ones."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('QUERY_STATS', True):
+            return
+        self.max_count = app.config.get('QUERY_COUNT_WARNING', 20)
+        self.max_time = app.config.get('QUERY_TIME_WARNING_MS', 250) / 1000.0
+        self.max_repeat = app.config.get('QUERY_REPEAT_WARNING', 5)
+        self.headers = app.config.get('QUERY_STATS_HEADERS', app.debug)
+        self.logger = app.logger
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start)
+        app.after_request(self._add_headers)
+        app.teardown_request(self._report)
+
+    @staticmethod
+    def current():
+        """Return the RequestStats of the running request, None outside one."""
+        return g.get('_query_stats') if has_app_context() else None
+
+    # Engine events.
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_query_start'].pop()
+        stats = self.current()
+        if stats is not None:
+            stats.add(statement, time.perf_counter() - started)
+
+    # Request hooks.
+
+    def _start(self):
+        g._query_stats = RequestStats()
+
+    def _add_headers(self, response):
+        stats = self.current()
+        if self.headers and stats is not None:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+        return response
+
+    def _report(self, exception=None):
+        stats = self.current()
+        if stats is None:
+            return
+        problems = []
+        if stats.count > self.max_count:
+            problems.append(f'{stats.count} queries')
+        if stats.duration > self.max_time:
+            problems.append(f'{stats.duration * 1000:.0f} ms in the database')
+        repeated = stats.repeated(self.max_repeat)
+        if repeated:
+            problems.append(f'{len(repeated)} statement(s) repeated, possible N+1')
+        if not problems:
+            return
+        lines = [f'{request.method} {request.path} ({request.endpoint}): ' + ', '.join(problems)]
+        for statement, count in repeated[:3]:
+            lines.append(f'  {count}x {statement[:300]}')
+        self.logger.warning('\n'.join(lines))
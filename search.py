@@ -0,0 +1,210 @@
+"""Name search for venues and artists.
+
+On Postgres the search runs against the pg_trgm GIN indexes created by
+migration 3f6b2c9d1e47 and results are ranked by trigram similarity.
+Other databases (the SQLite files used for test runs) are served by an
+in-process trigram index that follows the same matching and ranking rules.
+"""
+import re
+from collections import Counter
+
+from sqlalchemy import Float, String, and_, cast, event, func, or_
+from sqlalchemy.dialects import postgresql
+
+from forms import GENRES
+from pagination import paginate, paginate_sorted
+
+# fields a search may look in, 'name' is always searched
+SEARCH_FIELDS = ('name', 'city', 'state', 'genres')
+
+# pg_trgm's default for the % operator (pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """Return the set of trigrams of text the way pg_trgm extracts them.
+
+    Each alphanumeric word is lower cased and padded with two spaces in
+    front and one behind before being cut into three character slices.
+    """
+    grams = set()
+    for word in _WORD.findall((text or '').lower()):
+        padded = '  ' + word + ' '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def similarity(grams, other):
+    """Return the pg_trgm similarity of two trigram sets."""
+    if not grams or not other:
+        return 0.0
+    shared = len(grams & other)
+    return shared / float(len(grams) + len(other) - shared)
+
+
+def matching_genres(term):
+    """Return the known genres containing term, ignoring case."""
+    term = term.lower()
+    return [genre for genre in GENRES if term in genre.lower()]
+
+
+def genre_array(genres):
+    """Return genres as an array literal comparable with the varchar[] genres columns.
+
+    A bare ARRAY[...] of literals is text[], and Postgres has no
+    varchar[] && text[] or varchar[] @> text[] operator.
+    """
+    return cast(postgresql.array(list(genres)), postgresql.ARRAY(String))
+
+
+def has_genres(session, column, genres):
+    """Return the condition that the genres array in column holds every one of genres.
+
+    Postgres answers it with @> (served by the GIN indexes on the genres
+    columns), SQLite matches each quoted genre inside the stored JSON list.
+    """
+    if session.get_bind().dialect.name == 'postgresql':
+        return column.bool_op('@>')(genre_array(genres))
+    return and_(*[column.like(f'%"{genre}"%') for genre in genres])
+
+
+def has_genre(session, column, genre):
+    """Return the condition that the genres array in column holds genre."""
+    return has_genres(session, column, [genre])
+
+
+def clean_fields(fields):
+    """Return the searchable fields from a user supplied list."""
+    return ['name'] + [field for field in SEARCH_FIELDS[1:] if field in (fields or [])]
+
+
+class TrigramIndex(object):
+    """In-process equivalent of the pg_trgm indexes for one model.
+
+    Names are indexed twice: by their raw three character substrings to
+    answer ILIKE '%term%' without a scan, and by padded word trigrams to
+    find names similar to the term.
+    """
+
+    def __init__(self, rows):
+        self.documents = {}
+        self.substrings = {}
+        self.words = {}
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        name = (row.name or '').lower()
+        grams = trigrams(name)
+        self.documents[row.id] = {
+            'name': name,
+            'size': len(grams),
+            'city': (row.city or '').lower(),
+            'state': (row.state or '').upper(),
+            'genres': list(row.genres or []),
+        }
+        for i in range(len(name) - 2):
+            self.substrings.setdefault(name[i:i + 3], set()).add(row.id)
+        for gram in grams:
+            self.words.setdefault(gram, set()).add(row.id)
+
+    def _containing(self, term):
+        """Return the ids whose name contains term."""
+        if len(term) < 3:
+            return set(id for id, document in self.documents.items() if term in document['name'])
+        postings = sorted((self.substrings.get(term[i:i + 3], set()) for i in range(len(term) - 2)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return set(id for id in candidates if term in self.documents[id]['name'])
+
+    def lookup(self, term, fields=('name',)):
+        """Return a dict of id to rank for the documents matching term."""
+        term = term.lower()
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.words.get(gram, ()))
+
+        def rank(id):
+            count = shared.get(id, 0)
+            return count / float(len(grams) + self.documents[id]['size'] - count) if count else 0.0
+
+        # similarity can only reach the threshold when enough trigrams are shared
+        needed = SIMILARITY_THRESHOLD * len(grams)
+        ranks = {}
+        for id, count in shared.items():
+            if count >= needed:
+                score = rank(id)
+                if score >= SIMILARITY_THRESHOLD:
+                    ranks[id] = score
+        for id in self._containing(term):
+            ranks[id] = rank(id)
+
+        extra = [field for field in fields if field != 'name']
+        if extra:
+            genres = set(matching_genres(term))
+            for id, document in self.documents.items():
+                if id in ranks:
+                    continue
+                if ('city' in extra and term in document['city']
+                        or 'state' in extra and term.upper() == document['state']
+                        or 'genres' in extra and not genres.isdisjoint(document['genres'])):
+                    ranks[id] = rank(id)
+        return ranks
+
+
+_indexes = {}
+
+
+def _invalidate(mapper, connection, target):
+    _indexes.pop(mapper.class_, None)
+
+
+def register(model):
+    """Drop the in-process index of model whenever one of its rows changes."""
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, _invalidate)
+    return model
+
+
+def _index_for(session, model):
+    index = _indexes.get(model)
+    if index is None:
+        rows = session.query(model.id, model.name, model.city, model.state, model.genres)
+        index = _indexes[model] = TrigramIndex(rows)
+    return index
+
+
+def search(query, model, term, fields=('name',), after=None, before=None, size=30):
+    """Return a Page of query restricted to the rows of model matching term.
+
+    query must select model.id; the rows come back most relevant first,
+    ties broken by id, and the page total counts every match.
+    """
+    fields = clean_fields(fields)
+    session = query.session
+    if session.get_bind().dialect.name == 'postgresql':
+        like = f'%{term}%'
+        clauses = [model.name.ilike(like), model.name.bool_op('%')(term)]
+        if 'city' in fields:
+            clauses.append(model.city.ilike(like))
+        if 'state' in fields:
+            clauses.append(model.state == term.upper())
+        genres = matching_genres(term)
+        if 'genres' in fields and genres:
+            clauses.append(model.genres.bool_op('&&')(genre_array(genres)))
+        # double precision so the rank survives the round trip through a cursor
+        rank = cast(func.similarity(model.name, term), Float).label('rank')
+        query = query.add_columns(rank).filter(or_(*clauses))
+        page = paginate(query, [(rank, True), (model.id, False)], after, before, size)
+        page.total = session.query(func.count(model.id)).filter(or_(*clauses)).scalar()
+        return page
+
+    ranks = _index_for(session, model).lookup(term, fields)
+    page = paginate_sorted(sorted([-rank, id] for id, rank in ranks.items()), (float, int), after, before, size)
+    ids = [id for rank, id in page.items]
+    rows = dict((row.id, row) for row in query.filter(model.id.in_(ids)))
+    page.items = [rows[id] for id in ids if id in rows]
+    return page
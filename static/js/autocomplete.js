@@ -0,0 +1,52 @@
+// Suggests artists and venues by name while typing, from /api/v1/<kind>/autocomplete,
+// and copies the id of the picked one into the field named by data-target.
+(function () {
+  function label(match) {
+    return match.name + ' (' + [match.city, match.state].filter(Boolean).join(', ') + ') #' + match.id;
+  }
+
+  function attach(input) {
+    var target = document.getElementById(input.getAttribute('data-target'));
+    var list = document.getElementById(input.getAttribute('list'));
+    var url = input.getAttribute('data-autocomplete');
+    var ids = {};
+    var timer = null;
+    var latest = 0;
+
+    input.addEventListener('input', function () {
+      if (Object.prototype.hasOwnProperty.call(ids, input.value)) {
+        target.value = ids[input.value];
+        return;
+      }
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var query = input.value.trim();
+        var sent = ++latest;
+        if (!query) {
+          return;
+        }
+        fetch(url + '?q=' + encodeURIComponent(query), {credentials: 'same-origin'})
+          .then(function (response) { return response.json(); })
+          .then(function (matches) {
+            // answers can come back out of order, only the last one counts
+            if (sent !== latest) {
+              return;
+            }
+            ids = {};
+            list.innerHTML = '';
+            matches.forEach(function (match) {
+              var option = document.createElement('option');
+              option.value = label(match);
+              ids[option.value] = match.id;
+              list.appendChild(option);
+            });
+          });
+      }, 120);
+    });
+  }
+
+  var inputs = document.querySelectorAll('input[data-autocomplete]');
+  for (var i = 0; i < inputs.length; i++) {
+    attach(inputs[i]);
+  }
+})();